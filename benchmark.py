@@ -0,0 +1,239 @@
+'''benchmark suite for the lab kernels
+
+    python benchmark.py                              every kernel on every matrix
+    python benchmark.py -k sparse_cholesky -m 'riga_*'
+    python benchmark.py --json results.json --csv results.csv
+    python benchmark.py --save-baseline baseline.json
+    python benchmark.py --baseline baseline.json     exit code 1 on regressions
+
+every kernel is run warmup times, then timed repeats times, the median and
+95th percentile of the samples are reported together with the peak memory
+(tracemalloc, one extra run) and flops / s computed from the median'''
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import tracemalloc
+from time import perf_counter
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+for lab in ('lab5', 'lab2', 'lab1'):
+    sys.path.insert(0, os.path.join(ROOT, lab))
+
+from matmul import LOOP_ORDERS, mm_block, mm_tiled
+from strassen import strassen
+from cholesky import cholesky_LLT, cholesky_LLT_blocked, cholesky_LDLT_blocked
+from matrix_io import read_header, read_matrix_csr
+from matrix_functions import sparse_cholesky, matmul_CSR
+from cholesky_symbolic import symbolic_cholesky, numeric_cholesky
+from cholesky_supernodal import numeric_cholesky_supernodal
+from ordering import reverse_cuthill_mckee, approximate_minimum_degree, nested_dissection
+
+
+def find_matrices(root=ROOT, pattern='*'):
+    '''Octave text matrices from lab*/matrices, the same file copied
+        into several labs (same name and size) is taken once
+        returns {name: path}, name is lab/file without extension'''
+    matrices = {}
+    seen = set()
+    for path in sorted(glob.glob(os.path.join(root, 'lab*', 'matrices', pattern + '.txt'))):
+        key = (os.path.basename(path), os.path.getsize(path))
+        if key in seen:
+            continue
+        seen.add(key)
+        lab = os.path.basename(os.path.dirname(os.path.dirname(path)))
+        matrices['{}/{}'.format(lab, os.path.splitext(os.path.basename(path))[0])] = path
+    return matrices
+
+
+def _dense(csr):
+    return (csr.to_dense(),)
+
+
+def _sparse(csr):
+    return (csr,)
+
+
+def _symbolic(csr):
+    return (csr, symbolic_cholesky(csr))
+
+
+def _dense_flops(power, factor):
+    return lambda csr: factor * csr.shape[0] ** power
+
+
+def _spgemm_flops(csr):
+    # every A[i, k] multiplies the whole row k of B = A
+    return 2.0 * float(np.sum(np.diff(csr.ROWPTR)[csr.ICL]))
+
+
+def _cholesky_flops(csr):
+    return symbolic_cholesky(csr).flops
+
+
+# name: (prepare(csr) -> arguments, kernel(*arguments), flops(csr) or None, max n)
+# max n keeps the scalar python loops to the small matrices
+KERNELS = {}
+for _mm in LOOP_ORDERS:
+    KERNELS[_mm.__name__] = (lambda csr: (csr.to_dense(),) * 2, _mm, _dense_flops(3, 2), 100)
+KERNELS.update({
+    'mm_block': (lambda csr: (csr.to_dense(),) * 2, lambda a, b: mm_block(a, b, 64), _dense_flops(3, 2), None),
+    'mm_tiled': (lambda csr: (csr.to_dense(),) * 2, lambda a, b: mm_tiled(a, b, 64), _dense_flops(3, 2), None),
+    'strassen': (lambda csr: (csr.to_dense(),) * 2, lambda a, b: strassen(a, b, block_size=64),
+                 _dense_flops(3, 2), None),
+    'numpy_matmul': (lambda csr: (csr.to_dense(),) * 2, np.matmul, _dense_flops(3, 2), None),
+    'cholesky_LLT': (_dense, cholesky_LLT, _dense_flops(3, 1 / 3), 400),
+    'cholesky_LLT_blocked': (_dense, cholesky_LLT_blocked, _dense_flops(3, 1 / 3), None),
+    'cholesky_LDLT_blocked': (_dense, cholesky_LDLT_blocked, _dense_flops(3, 1 / 3), None),
+    'numpy_cholesky': (_dense, np.linalg.cholesky, _dense_flops(3, 1 / 3), None),
+    'sparse_cholesky': (_sparse, sparse_cholesky, _cholesky_flops, None),
+    'symbolic_cholesky': (_sparse, symbolic_cholesky, None, None),
+    'numeric_cholesky': (_symbolic, numeric_cholesky, _cholesky_flops, None),
+    'numeric_cholesky_supernodal': (_symbolic, numeric_cholesky_supernodal, _cholesky_flops, None),
+    'matmul_CSR': (lambda csr: (csr, csr), matmul_CSR, _spgemm_flops, None),
+    'rcm': (_sparse, reverse_cuthill_mckee, None, None),
+    'amd': (_sparse, approximate_minimum_degree, None, None),
+    'nested_dissection': (_sparse, nested_dissection, None, None),
+})
+
+
+def measure(kernel, arguments, warmup=1, repeats=5):
+    '''returns (samples [s], peak memory [B])'''
+    for _ in range(warmup):
+        kernel(*arguments)
+
+    samples = []
+    for _ in range(repeats):
+        start = perf_counter()
+        kernel(*arguments)
+        samples.append(perf_counter() - start)
+
+    # separate run - tracing makes allocations slower, so it is not timed
+    tracemalloc.start()
+    kernel(*arguments)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return samples, peak
+
+
+def run_benchmarks(kernels, matrices, warmup=1, repeats=5, max_size=None, log=print):
+    '''runs every kernel on every matrix, returns list of result rows (dicts)'''
+    results = []
+    for matrix_name, path in matrices.items():
+        # the size is in the header - too big matrices are not even loaded
+        with open(path, 'r') as file:
+            n = read_header(file)['rows']
+        if max_size is not None and n > max_size:
+            continue
+
+        csr = None
+        for kernel_name in kernels:
+            prepare, kernel, flops, kernel_max_size = KERNELS[kernel_name]
+            if kernel_max_size is not None and n > kernel_max_size:
+                continue
+            if csr is None:
+                csr = read_matrix_csr(path)
+
+            samples, peak = measure(kernel, prepare(csr), warmup, repeats)
+            median = float(np.median(samples))
+            operations = flops(csr) if flops is not None else None
+            results.append({
+                'kernel': kernel_name,
+                'matrix': matrix_name,
+                'n': n,
+                'nnz': csr.nnz,
+                'median_s': median,
+                'p95_s': float(np.percentile(samples, 95)),
+                'peak_memory_B': peak,
+                'flops_per_s': operations / median if operations is not None and median > 0 else None,
+            })
+            if log is not None:
+                log('{:<28} {:<16} n={:<6} median {:.6f} s  p95 {:.6f} s  peak {:.1f} kB'.format(
+                    kernel_name, matrix_name, n, median, results[-1]['p95_s'], peak / 1024))
+
+    return results
+
+
+def write_csv(file_name, results):
+    fields = ['kernel', 'matrix', 'n', 'nnz', 'median_s', 'p95_s', 'peak_memory_B', 'flops_per_s']
+    with open(file_name, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fields)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def write_json(file_name, results):
+    with open(file_name, 'w') as file:
+        json.dump(results, file, indent=2)
+
+
+def read_json(file_name):
+    with open(file_name) as file:
+        return json.load(file)
+
+
+def compare_with_baseline(results, baseline, threshold=0.2):
+    '''rows whose median time is more than threshold (fraction) slower than
+        the baseline row of the same kernel and matrix
+        returns list of (kernel, matrix, baseline median, median)'''
+    reference = {(row['kernel'], row['matrix']): row['median_s'] for row in baseline}
+    regressions = []
+    for row in results:
+        key = (row['kernel'], row['matrix'])
+        if key in reference and row['median_s'] > reference[key] * (1 + threshold):
+            regressions.append((row['kernel'], row['matrix'], reference[key], row['median_s']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='benchmark the lab kernels on lab*/matrices')
+    parser.add_argument('-k', '--kernels', nargs='+', default=list(KERNELS),
+                        choices=list(KERNELS), metavar='KERNEL', help='kernels to run (default all)')
+    parser.add_argument('-m', '--matrices', default='*', help='file name pattern, e.g. "riga_*"')
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--max-size', type=int, default=None, help='skip matrices bigger than n')
+    parser.add_argument('--csv', help='write results to csv file')
+    parser.add_argument('--json', help='write results to json file')
+    parser.add_argument('--save-baseline', help='write results as the baseline json file')
+    parser.add_argument('--baseline', help='compare with the baseline json file')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed slowdown against the baseline (default 0.2 = 20%%)')
+    parser.add_argument('--list', action='store_true', help='list kernels and matrices and exit')
+    args = parser.parse_args(argv)
+
+    matrices = find_matrices(pattern=args.matrices)
+    if args.list:
+        print('kernels: ' + ' '.join(KERNELS))
+        for name, path in matrices.items():
+            print('{:<20} {}'.format(name, os.path.relpath(path, ROOT)))
+        return 0
+
+    results = run_benchmarks(args.kernels, matrices, args.warmup, args.repeats, args.max_size)
+
+    if args.csv:
+        write_csv(args.csv, results)
+    if args.json:
+        write_json(args.json, results)
+    if args.save_baseline:
+        write_json(args.save_baseline, results)
+
+    if args.baseline:
+        regressions = compare_with_baseline(results, read_json(args.baseline), args.threshold)
+        for kernel, matrix, before, after in regressions:
+            print('REGRESSION {} on {}: {:.6f} s -> {:.6f} s ({:+.0%})'.format(
+                kernel, matrix, before, after, after / before - 1))
+        if regressions:
+            return 1
+        print('no regressions against {}'.format(args.baseline))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,187 @@
+import json
+import os
+import platform
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+import numpy as np
+
+
+def mm_ijp(matrix_a, matrix_b):
+    (m, n), k = matrix_a.shape, matrix_b.shape[1]
+    matrix_c = np.zeros((m, k), dtype=np.float64)
+    for i in range(m):
+        for j in range(k):
+            for p in range(n):
+                matrix_c[i, j] += matrix_a[i, p] * matrix_b[p, j]
+    return matrix_c
+
+
+def mm_ipj(matrix_a, matrix_b):
+    (m, n), k = matrix_a.shape, matrix_b.shape[1]
+    matrix_c = np.zeros((m, k), dtype=np.float64)
+    for i in range(m):
+        for p in range(n):
+            for j in range(k):
+                matrix_c[i, j] += matrix_a[i, p] * matrix_b[p, j]
+    return matrix_c
+
+
+def mm_jip(matrix_a, matrix_b):
+    (m, n), k = matrix_a.shape, matrix_b.shape[1]
+    matrix_c = np.zeros((m, k), dtype=np.float64)
+    for j in range(k):
+        for i in range(m):
+            for p in range(n):
+                matrix_c[i, j] += matrix_a[i, p] * matrix_b[p, j]
+    return matrix_c
+
+
+def mm_jpi(matrix_a, matrix_b):
+    (m, n), k = matrix_a.shape, matrix_b.shape[1]
+    matrix_c = np.zeros((m, k), dtype=np.float64)
+    for j in range(k):
+        for p in range(n):
+            for i in range(m):
+                matrix_c[i, j] += matrix_a[i, p] * matrix_b[p, j]
+    return matrix_c
+
+
+def mm_pij(matrix_a, matrix_b):
+    (m, n), k = matrix_a.shape, matrix_b.shape[1]
+    matrix_c = np.zeros((m, k), dtype=np.float64)
+    for p in range(n):
+        for i in range(m):
+            for j in range(k):
+                matrix_c[i, j] += matrix_a[i, p] * matrix_b[p, j]
+    return matrix_c
+
+
+def mm_pji(matrix_a, matrix_b):
+    (m, n), k = matrix_a.shape, matrix_b.shape[1]
+    matrix_c = np.zeros((m, k), dtype=np.float64)
+    for p in range(n):
+        for j in range(k):
+            for i in range(m):
+                matrix_c[i, j] += matrix_a[i, p] * matrix_b[p, j]
+    return matrix_c
+
+
+LOOP_ORDERS = [mm_ijp, mm_ipj, mm_jip, mm_jpi, mm_pij, mm_pji]
+
+
+def mm_block(matrix_a, matrix_b, block_size):
+    '''blocked A @ B for any (m x n) @ (n x k) shapes
+        tile bounds come from their own dimension (ib from m, jb from k,
+        pb from n) and every tile product is one vectorized A_tile @ B_tile'''
+    (m, n), k = matrix_a.shape, matrix_b.shape[1]
+    if matrix_b.shape[0] != n:
+        raise ValueError('shapes {} and {} not aligned'.format(matrix_a.shape, matrix_b.shape))
+    matrix_c = np.zeros((m, k))
+
+    for i in range(0, m, block_size):
+        ib = min(m - i, block_size)
+        for j in range(0, k, block_size):
+            jb = min(k - j, block_size)
+            for p in range(0, n, block_size):
+                pb = min(n - p, block_size)
+                matrix_c[i:i+ib, j:j+jb] += matrix_a[i:i+ib, p:p+pb] @ matrix_b[p:p+pb, j:j+jb]
+    return matrix_c
+
+
+def _tile_product(matrix_a, matrix_b, matrix_c, i, j, block_size):
+    # whole C tile is computed by one task, so no two tasks write the same memory
+    (m, n), k = matrix_a.shape, matrix_b.shape[1]
+    ib = min(m - i, block_size)
+    jb = min(k - j, block_size)
+    tile = matrix_c[i:i+ib, j:j+jb]
+    for p in range(0, n, block_size):
+        pb = min(n - p, block_size)
+        tile += matrix_a[i:i+ib, p:p+pb] @ matrix_b[p:p+pb, j:j+jb]
+
+
+def mm_tiled(matrix_a, matrix_b, block_size=None, workers=None, out=None):
+    '''A @ B split into block_size x block_size tiles of C, tiles are
+        computed by a thread pool (numpy releases the GIL in matmul)
+        block_size=None uses the autotuned tile size (tuned_block_size),
+        workers=None one thread per CPU
+        out - (m x k) array C is written into instead of a new one'''
+    matrix_a = np.asarray(matrix_a, dtype=np.float64)
+    matrix_b = np.asarray(matrix_b, dtype=np.float64)
+    (m, n), k = matrix_a.shape, matrix_b.shape[1]
+    if matrix_b.shape[0] != n:
+        raise ValueError('shapes {} and {} not aligned'.format(matrix_a.shape, matrix_b.shape))
+    if block_size is None:
+        block_size = tuned_block_size()
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if out is None:
+        matrix_c = np.zeros((m, k))
+    else:
+        matrix_c = out
+        matrix_c[:] = 0
+    tiles = [(i, j) for i in range(0, m, block_size) for j in range(0, k, block_size)]
+
+    if workers == 1 or len(tiles) == 1:
+        for i, j in tiles:
+            _tile_product(matrix_a, matrix_b, matrix_c, i, j, block_size)
+    else:
+        with ThreadPoolExecutor(workers) as pool:
+            futures = [pool.submit(_tile_product, matrix_a, matrix_b, matrix_c, i, j, block_size)
+                       for i, j in tiles]
+            for future in futures:
+                future.result()
+
+    return matrix_c
+
+
+def machine_id():
+    '''key of the autotuning results - the same machine gets the same tile size'''
+    return '{}-{}-{}-{}cpu'.format(platform.node(), platform.machine(),
+                                   platform.processor() or 'unknown', os.cpu_count())
+
+
+def tuning_file():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'mm_tiled.json')
+
+
+def autotune_block_size(n=512, block_sizes=(32, 64, 128, 256, 512), repeats=3, workers=None):
+    '''times mm_tiled on random n x n matrices for every block size
+        (best of repeats), returns (best block size, {block size: time [s]})'''
+    generator = np.random.default_rng(0)
+    matrix_a = generator.standard_normal((n, n))
+    matrix_b = generator.standard_normal((n, n))
+
+    times = {}
+    for block_size in block_sizes:
+        best = float('inf')
+        for _ in range(repeats):
+            start = time()
+            mm_tiled(matrix_a, matrix_b, block_size, workers)
+            best = min(best, time() - start)
+        times[block_size] = best
+
+    return min(times, key=times.get), times
+
+
+def tuned_block_size(file_name=None, retune=False):
+    '''tile size for this machine - benchmarked once with autotune_block_size,
+        then read from the json file (.cache/mm_tiled.json next to this module)'''
+    if file_name is None:
+        file_name = tuning_file()
+
+    results = {}
+    if os.path.exists(file_name):
+        with open(file_name) as file:
+            results = json.load(file)
+
+    key = machine_id()
+    if key not in results or retune:
+        block_size, times = autotune_block_size()
+        results[key] = {'block_size': block_size, 'times': {str(b): t for b, t in times.items()}}
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        with open(file_name, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    return results[key]['block_size']
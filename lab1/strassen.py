@@ -0,0 +1,192 @@
+from time import time
+
+import numpy as np
+
+from matmul import mm_block, mm_tiled, tuned_block_size
+
+
+def _levels(m, n, k, cutoff):
+    '''number of halvings until one of the dimensions gets below cutoff'''
+    levels = 0
+    while min(m, n, k) / 2 ** levels > cutoff:
+        levels += 1
+    return levels
+
+
+def _workspace(m, n, k, levels):
+    '''scratch matrices for every recursion level, allocated once per call:
+        X for sums of A quadrants, Y for sums of B quadrants, Z for products'''
+    workspace = []
+    for _ in range(levels):
+        m, n, k = m // 2, n // 2, k // 2
+        workspace.append((np.empty((m, n)), np.empty((n, k)), np.empty((m, k))))
+    return workspace
+
+
+def _quadrants(matrix):
+    rows, cols = matrix.shape[0] // 2, matrix.shape[1] // 2
+    return (matrix[:rows, :cols], matrix[:rows, cols:],
+            matrix[rows:, :cols], matrix[rows:, cols:])
+
+
+def _strassen(A, B, C, workspace, level, kernel):
+    '''C = A @ B with the classic Strassen formulas, written into C'''
+    if level == len(workspace):
+        kernel(A, B, C)
+        return
+
+    X, Y, Z = workspace[level]
+    A11, A12, A21, A22 = _quadrants(A)
+    B11, B12, B21, B22 = _quadrants(B)
+    C11, C12, C21, C22 = _quadrants(C)
+
+    def product(a, b):
+        _strassen(a, b, Z, workspace, level + 1, kernel)
+        return Z
+
+    np.add(A11, A22, out=X)
+    np.add(B11, B22, out=Y)
+    M = product(X, Y)                      # M1
+    C11[:] = M
+    C22[:] = M
+
+    np.add(A21, A22, out=X)
+    M = product(X, B11)                    # M2
+    C21[:] = M
+    C22 -= M
+
+    np.subtract(B12, B22, out=Y)
+    M = product(A11, Y)                    # M3
+    C12[:] = M
+    C22 += M
+
+    np.subtract(B21, B11, out=Y)
+    M = product(A22, Y)                    # M4
+    C11 += M
+    C21 += M
+
+    np.add(A11, A12, out=X)
+    M = product(X, B22)                    # M5
+    C11 -= M
+    C12 += M
+
+    np.subtract(A21, A11, out=X)
+    np.add(B11, B12, out=Y)
+    C22 += product(X, Y)                   # M6
+
+    np.subtract(A12, A22, out=X)
+    np.add(B21, B22, out=Y)
+    C11 += product(X, Y)                   # M7
+
+
+def _winograd(A, B, C, workspace, level, kernel):
+    '''C = A @ B with the Strassen-Winograd variant (7 products, 15 additions),
+        products go straight into the C quadrants, so only X, Y, Z are needed'''
+    if level == len(workspace):
+        kernel(A, B, C)
+        return
+
+    X, Y, Z = workspace[level]
+    A11, A12, A21, A22 = _quadrants(A)
+    B11, B12, B21, B22 = _quadrants(B)
+    C11, C12, C21, C22 = _quadrants(C)
+
+    def product(a, b, c):
+        _winograd(a, b, c, workspace, level + 1, kernel)
+
+    np.subtract(A11, A21, out=X)           # S3
+    np.subtract(B22, B12, out=Y)           # T3
+    product(X, Y, C21)                     # M7
+    np.add(A21, A22, out=X)                # S1
+    np.subtract(B12, B11, out=Y)           # T1
+    product(X, Y, C22)                     # M5
+    X -= A11                               # S2
+    np.subtract(B22, Y, out=Y)             # T2
+    product(X, Y, C12)                     # M6
+    np.subtract(A12, X, out=X)             # S4
+    product(X, B22, C11)                   # M3
+    product(A11, B11, Z)                   # M1
+
+    C12 += Z                               # U2 = M1 + M6
+    C21 += C12                             # U3 = U2 + M7
+    C12 += C22                             # U4 = U2 + M5
+    C22 += C21                             # C22 = U3 + M5
+    C12 += C11                             # C12 = U4 + M3
+
+    Y -= B21                               # T4
+    product(A22, Y, C11)                   # M4
+    C21 -= C11                             # C21 = U3 - M4
+    product(A12, B21, C11)                 # M2
+    C11 += Z                               # C11 = M1 + M2
+
+
+def numpy_kernel(a, b, c):
+    '''leaf kernel for strassen that leaves the leaves to numpy (BLAS)'''
+    np.matmul(a, b, out=c)
+
+
+def strassen(matrix_a, matrix_b, cutoff=256, variant='winograd', kernel=None, block_size=None, workers=1):
+    '''A @ B with recursive Strassen ('strassen') or Strassen-Winograd
+        ('winograd') multiplication, O(n^2.81)
+        recursion stops once a dimension drops to cutoff and the block is
+        multiplied by kernel(a, b, c) - c = a @ b written into c, by default
+        mm_tiled with block_size (None - the autotuned one) and workers
+        threads, kernel=numpy_kernel uses np.matmul instead
+        dimensions are zero padded once to multiples of 2^levels, so every
+        level splits evenly, scratch for all levels is allocated up front'''
+    matrix_a = np.asarray(matrix_a, dtype=np.float64)
+    matrix_b = np.asarray(matrix_b, dtype=np.float64)
+    (m, n), k = matrix_a.shape, matrix_b.shape[1]
+    if matrix_b.shape[0] != n:
+        raise ValueError('shapes {} and {} not aligned'.format(matrix_a.shape, matrix_b.shape))
+    if variant not in ('strassen', 'winograd'):
+        raise ValueError('unknown variant {}'.format(variant))
+    if kernel is None:
+        if block_size is None:
+            block_size = tuned_block_size()
+
+        def kernel(a, b, c):
+            mm_tiled(a, b, block_size, workers, out=c)
+
+    levels = _levels(m, n, k, cutoff)
+    step = 2 ** levels
+    pm, pn, pk = -m % step, -n % step, -k % step
+    A = np.pad(matrix_a, ((0, pm), (0, pn))) if pm or pn else matrix_a
+    B = np.pad(matrix_b, ((0, pn), (0, pk))) if pn or pk else matrix_b
+    C = np.empty((m + pm, k + pk))
+
+    recursion = _winograd if variant == 'winograd' else _strassen
+    recursion(A, B, C, _workspace(m + pm, n + pn, k + pk, levels), 0, kernel)
+
+    return C[:m, :k] if pm or pk else C
+
+
+def crossover_benchmark(sizes=(128, 256, 512, 1024, 2048), cutoff=256, block_size=64, repeats=3):
+    '''times of strassen, winograd (both with mm_tiled leaves), mm_tiled,
+        mm_block, winograd with numpy_kernel leaves and @ for random n x n
+        matrices (best of repeats), shows from which size the recursion pays off
+        returns {n: {name: time [s]}} (pd.DataFrame(times).T friendly)'''
+    generator = np.random.default_rng(0)
+    methods = {
+        'strassen': lambda a, b: strassen(a, b, cutoff, 'strassen', block_size=block_size),
+        'winograd': lambda a, b: strassen(a, b, cutoff, 'winograd', block_size=block_size),
+        'mm_tiled': lambda a, b: mm_tiled(a, b, block_size, 1),
+        'mm_block': lambda a, b: mm_block(a, b, block_size),
+        'winograd (numpy)': lambda a, b: strassen(a, b, cutoff, 'winograd', numpy_kernel),
+        '@': lambda a, b: a @ b,
+    }
+
+    times = {}
+    for n in sizes:
+        matrix_a = generator.standard_normal((n, n))
+        matrix_b = generator.standard_normal((n, n))
+        times[n] = {}
+        for name, method in methods.items():
+            best = float('inf')
+            for _ in range(repeats):
+                start = time()
+                method(matrix_a, matrix_b)
+                best = min(best, time() - start)
+            times[n][name] = best
+
+    return times
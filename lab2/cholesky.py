@@ -0,0 +1,302 @@
+from time import time
+
+import numpy as np
+
+
+def cholesky_LDLT(matrix):
+    A = matrix.copy()
+    n = A.shape[0]
+
+    for k in range(n):
+        dkk = A[k, k]
+        if abs(dkk) < 1e-8:
+            raise ValueError('singular matrix')
+
+        vk = A[k+1:n, k].copy()
+        A[k+1:n, k] /= dkk
+
+        for j in range(k + 1, n):
+            A[j:n, j] -= A[j:n, k] * vk[j-k-1]
+
+    D = np.diag(A)*np.eye(n)
+
+    return np.tril(A) - D + np.eye(n), D
+
+
+def cholesky_LLT(matrix):
+    A = matrix.copy()
+    n = A.shape[0]
+
+    for k in range(n):
+        if abs(A[k, k]) < 1e-8:
+            raise ValueError('singular matrix')
+
+        vk = A[k+1:n, k]
+        A[k, k] **= 0.5
+        dkk = A[k, k]
+        A[k+1:n, k] /= dkk
+
+        for j in range(k+1, n):
+            A[j:n, j] -= A[j:n, k]*vk[j-k-1]
+
+    return np.tril(A)
+
+
+def _panel_LLT(panel):
+    '''unblocked LLT of the panel A[k:n, k:k+b] in place -
+        every pivot updates only the remaining panel columns (one outer product)'''
+    b = panel.shape[1]
+    for j in range(b):
+        if abs(panel[j, j]) < 1e-8:
+            raise ValueError('singular matrix')
+
+        panel[j, j] **= 0.5
+        panel[j+1:, j] /= panel[j, j]
+        panel[j+1:, j+1:] -= np.outer(panel[j+1:, j], panel[j+1:b, j])
+
+
+def _panel_LDLT(panel):
+    '''unblocked LDLT of the panel A[k:n, k:k+b] in place,
+        D stays on the diagonal, L below it'''
+    b = panel.shape[1]
+    for j in range(b):
+        dkk = panel[j, j]
+        if abs(dkk) < 1e-8:
+            raise ValueError('singular matrix')
+
+        vk = panel[j+1:b, j].copy()
+        panel[j+1:, j] /= dkk
+        panel[j+1:, j+1:] -= np.outer(panel[j+1:, j], vk)
+
+
+def cholesky_LLT_blocked(matrix, block_size=32, dtype=np.float64):
+    '''right-looking blocked LLT, returns L
+        panel of block_size columns is factored with rank-1 updates limited
+        to the panel, then the whole trailing matrix gets one update
+        A22 -= L21 @ L21.T - a single matrix product per panel
+        dtype=np.float32 factors in single precision'''
+    A = np.array(matrix, dtype=dtype)
+    n = A.shape[0]
+
+    for k in range(0, n, block_size):
+        kb = min(n - k, block_size)
+        _panel_LLT(A[k:, k:k+kb])
+
+        L21 = A[k+kb:, k:k+kb]
+        A[k+kb:, k+kb:] -= L21 @ L21.T
+
+    return np.tril(A)
+
+
+def cholesky_LDLT_blocked(matrix, block_size=32, dtype=np.float64):
+    '''right-looking blocked LDLT, returns (L, D) like cholesky_LDLT
+        trailing update of every panel is A22 -= L21 @ (L21 D1).T
+        dtype=np.float32 factors in single precision'''
+    A = np.array(matrix, dtype=dtype)
+    n = A.shape[0]
+
+    for k in range(0, n, block_size):
+        kb = min(n - k, block_size)
+        _panel_LDLT(A[k:, k:k+kb])
+
+        L21 = A[k+kb:, k:k+kb]
+        d1 = np.diag(A[k:k+kb, k:k+kb])
+        A[k+kb:, k+kb:] -= L21 @ (L21 * d1).T
+
+    D = np.diag(np.diag(A))
+
+    return np.tril(A) - D + np.eye(n, dtype=dtype), D
+
+
+def _substitution(L, B, lower, block_size):
+    # blocked forward (lower) or back (L.T) substitution, only the small
+    # diagonal blocks go through np.linalg.solve
+    n = L.shape[0]
+    X = np.zeros(B.shape, dtype=np.result_type(L, B))
+    starts = range(0, n, block_size) if lower else reversed(range(0, n, block_size))
+    for k in starts:
+        kb = min(n - k, block_size)
+        if lower:
+            rhs = B[k:k+kb] - L[k:k+kb, :k] @ X[:k]
+            X[k:k+kb] = np.linalg.solve(L[k:k+kb, k:k+kb], rhs)
+        else:
+            rhs = B[k:k+kb] - L[k+kb:, k:k+kb].T @ X[k+kb:]
+            X[k:k+kb] = np.linalg.solve(L[k:k+kb, k:k+kb].T, rhs)
+    return X
+
+
+def cholesky_solve_dense(L, B, D=None, block_size=32):
+    '''X with L @ L.T @ X = B (L from cholesky_LLT_blocked) or
+        L @ D @ L.T @ X = B (L, D from cholesky_LDLT_blocked),
+        computed in the precision of L'''
+    B = np.asarray(B, dtype=L.dtype)
+    Y = _substitution(L, B, True, block_size)
+    if D is not None:
+        d = np.diag(D)
+        Y = Y / (d if Y.ndim == 1 else d[:, None])
+    return _substitution(L, Y, False, block_size)
+
+
+def mixed_precision_solve(matrix, B, method='LLT', tol=1e-12, max_iter=10, stall=0.5,
+                          block_size=32, fallback=True):
+    '''solves matrix @ X = B with the blocked LLT or LDLT factored in float32
+        (dtype=np.float32), the float64 accuracy is recovered by iterative
+        refinement: X += solve(B - matrix @ X), residual in float64, until
+        norm(r) <= tol * norm(b), a step that does not reduce the residual
+        at least by the stall factor stops it
+        when the refinement does not converge or the float32 factorization
+        breaks down, the matrix is factored again in float64 (fallback=False
+        returns the refined float32 result, or raises ValueError)
+        returns (X, info) - info has iterations, converged, stalled, residuals
+        (largest relative residual norm before every step) and fallback'''
+    if method not in ('LDLT', 'LLT'):
+        raise ValueError('unknown method {}'.format(method))
+    factorization = cholesky_LDLT_blocked if method == 'LDLT' else cholesky_LLT_blocked
+    A = np.asarray(matrix, dtype=np.float64)
+    B = np.asarray(B, dtype=np.float64)
+    B_norm = np.linalg.norm(B, axis=0)
+    B_norm = np.where(B_norm == 0, 1.0, B_norm)
+
+    info = {'iterations': 0, 'residuals': []}
+    for dtype in (np.float32, np.float64):
+        try:
+            # a negative pivot of LLT gives nan instead of an exception
+            with np.errstate(invalid='ignore'):
+                factor = factorization(A, block_size, dtype)
+            L, D = factor if method == 'LDLT' else (factor, None)
+            if not np.all(np.isfinite(np.diag(L))):
+                raise ValueError('nonpositive value on diagonal')
+        except ValueError:
+            if not fallback or dtype == np.float64:
+                raise
+            continue
+
+        X = cholesky_solve_dense(L, B, D, block_size).astype(np.float64)
+        while True:
+            R = B - A @ X
+            info['residuals'].append(float(np.max(np.linalg.norm(R, axis=0) / B_norm)))
+            converged = info['residuals'][-1] <= tol
+            stalled = len(info['residuals']) > 1 and info['residuals'][-1] > stall * info['residuals'][-2]
+            if converged or stalled or info['iterations'] == max_iter:
+                break
+            X += cholesky_solve_dense(L, R, D, block_size)
+            info['iterations'] += 1
+
+        if converged or not fallback or dtype == np.float64:
+            info.update(converged=converged, stalled=stalled, fallback=dtype == np.float64)
+            return X, info
+
+
+def _rank_update(L, W, sign):
+    '''L of L @ L.T + sign * W @ W.T, columns of L are processed once and
+        every one gets the rotations of all columns of W, so L is traversed
+        a single time for the whole rank-k change, O(k n^2)'''
+    L = np.array(L, dtype=np.result_type(L, np.float32))
+    W = np.array(W, dtype=np.float64).reshape(len(L), -1)
+    n = L.shape[0]
+
+    for k in range(n):
+        for j in range(W.shape[1]):
+            wk = W[k, j]
+            if wk == 0:
+                continue
+            lkk = L[k, k]
+            rkk = lkk * lkk + sign * wk * wk
+            if rkk <= 0:
+                raise ValueError('nonpositive value on diagonal')
+            rkk **= 0.5
+            c, s = rkk / lkk, wk / lkk
+            L[k, k] = rkk
+            L[k+1:, k] = (L[k+1:, k] + sign * s * W[k+1:, j]) / c
+            W[k+1:, j] = c * W[k+1:, j] - s * L[k+1:, k]
+
+    return L
+
+
+def cholesky_update(L, W):
+    '''L of L @ L.T + W @ W.T without refactoring, L from cholesky_LLT
+        (or cholesky_LLT_blocked), W one vector or k vectors as columns'''
+    return _rank_update(L, W, 1)
+
+
+def cholesky_downdate(L, W):
+    '''L of L @ L.T - W @ W.T, raises ValueError when the result
+        is not positive definite'''
+    return _rank_update(L, W, -1)
+
+
+def partial_factorization(matrix, p, method='LDLT', block_size=32):
+    '''eliminates only the first p pivots with the blocked panel kernels
+        panels are factored over the whole height, so L21 comes out with L11,
+        but the trailing updates stay inside the first p columns - A22 is
+        updated once at the end: S = A22 - L21 @ D1 @ L21.T
+        method 'LDLT' or 'LLT' (D1 = I), returns (L1, d, S):
+        L1 = [L11; L21] (n x p), d - diagonal of D1, S - Schur complement'''
+    A = np.array(matrix, dtype=np.float64)
+    n = A.shape[0]
+    if method not in ('LDLT', 'LLT'):
+        raise ValueError('unknown method {}'.format(method))
+    panel_factor = _panel_LDLT if method == 'LDLT' else _panel_LLT
+
+    for k in range(0, p, block_size):
+        kb = min(p - k, block_size)
+        panel_factor(A[k:, k:k+kb])
+
+        L = A[k+kb:, k:k+kb]
+        W = L * np.diag(A[k:k+kb, k:k+kb]) if method == 'LDLT' else L
+        A[k+kb:, k+kb:p] -= L @ W[:p-k-kb].T
+
+    L1 = np.tril(A[:, :p])
+    if method == 'LDLT':
+        d = np.diag(A[:p, :p]).copy()
+        L1[np.arange(p), np.arange(p)] = 1
+    else:
+        d = np.ones(p)
+
+    L21 = L1[p:]
+    S = A[p:, p:] - L21 @ (L21 * d).T
+    return L1, d, S
+
+
+def schur_complement(matrix, m=1, method='LDLT', block_size=32):
+    '''Schur complement of the last m x m block, A22 - A21 @ inv(A11) @ A12
+        schur_LDLT / schur_LLT from the notebook only update the lower
+        triangle, so they agree with it below the diagonal'''
+    n = matrix.shape[0]
+    return partial_factorization(matrix, max(0, n - m), method, block_size)[2]
+
+
+def block_size_sweep(matrix, block_sizes=(8, 16, 32, 64, 128, 256), function=cholesky_LLT_blocked):
+    '''time of the blocked factorization for every block size,
+        the same methodology as compare_block_times for mm_block in lab1
+        returns {block size: time [s]}'''
+    times = {}
+    for block_size in block_sizes:
+        start = time()
+        function(matrix, block_size)
+        times[block_size] = time() - start
+
+    return times
+
+
+def compare_with_numpy(matrices, block_size=32):
+    '''times of blocked LLT and LDLT against np.linalg.cholesky
+        returns {n: {name: time [s]}} (pd.DataFrame(times).T friendly)'''
+    times = {}
+    for matrix in matrices:
+        n = matrix.shape[0]
+        times[n] = {}
+
+        start = time()
+        cholesky_LLT_blocked(matrix, block_size)
+        times[n]['LLT blocked'] = time() - start
+
+        start = time()
+        cholesky_LDLT_blocked(matrix, block_size)
+        times[n]['LDLT blocked'] = time() - start
+
+        start = time()
+        np.linalg.cholesky(matrix)
+        times[n]['np.linalg.cholesky'] = time() - start
+
+    return times
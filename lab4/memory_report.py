@@ -0,0 +1,42 @@
+import os
+import sys
+import tracemalloc
+
+import numpy as np
+
+LAB5 = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lab5')
+if LAB5 not in sys.path:
+    sys.path.append(LAB5)
+
+from matrix_functions import convert_to_csr, sparse_cholesky
+from cholesky_inplace import sparse_cholesky_inplace
+
+
+def peak_memory(function, *args):
+    '''peak memory [B] allocated while function(*args) runs (tracemalloc)'''
+    tracemalloc.start()
+    function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def compare_memory(matrix):
+    '''peak memory of dense Cholesky, the list based sparse_cholesky and the
+        in-place sparse_cholesky_inplace for a dense matrix, the CSR conversion
+        is done before the measurement, so only the factorizations are compared
+        factor_bytes is the size of the L.T arrays - the lower bound of the sparse
+        variants, in-place one should stay close to it'''
+    csr = convert_to_csr(matrix)
+    factor = sparse_cholesky_inplace(csr)
+
+    memory = {
+        'dense': peak_memory(np.linalg.cholesky, matrix),
+        'sparse': peak_memory(sparse_cholesky, csr),
+        'sparse in-place': peak_memory(sparse_cholesky_inplace, csr),
+        'factor_bytes': factor.nbytes,
+    }
+
+    for name, value in memory.items():
+        print('{:<16} {:>12} B'.format(name, value))
+    return memory
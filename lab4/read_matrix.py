@@ -10,9 +10,14 @@ def read_matrix(file_name):
                 if line[2:6] == "rows":
                     _, _, size = line.split()
                     size = int(size)
-                    matrix = np.zeros((size, size))
             else:
-                row, col, val = line.split(' ')
-                matrix[int(row)-1, int(col)-1] = val
-            
+                # the rest of the file is the triplet body, parsed at once
+                body = line + file.read()
+                break
+        else:
+            body = ''
+
+    triplets = np.fromstring(body, sep=' ').reshape(-1, 3)
+    matrix = np.zeros((size, size))
+    matrix[triplets[:, 0].astype(int) - 1, triplets[:, 1].astype(int) - 1] = triplets[:, 2]
     return matrix
@@ -0,0 +1,212 @@
+import numpy as np
+
+from csr_matrix import CSRMatrix
+from matrix_functions import matmul_CSR_symbolic
+from cholesky_symbolic import symbolic_cholesky
+
+
+class BSRMatrix:
+    '''matrix in Block Sparse Row format - CSR whose entries are dense
+        r x r blocks (r = blocksize)
+        ICL    - block column of every stored block
+        VAL    - stored blocks, shape (number of blocks, r, r)
+        ROWPTR - ICL/VAL index where every block row starts'''
+
+    __slots__ = ('ICL', 'VAL', 'ROWPTR', 'blocksize', 'shape')
+
+    def __init__(self, ICL, VAL, ROWPTR, blocksize, shape=None):
+        self.ICL = np.asarray(ICL, dtype=np.int64)
+        self.VAL = np.asarray(VAL, dtype=np.float64).reshape(-1, blocksize, blocksize)
+        self.ROWPTR = np.asarray(ROWPTR, dtype=np.int64)
+        self.blocksize = blocksize
+        if shape is None:
+            n = (len(self.ROWPTR) - 1) * blocksize
+            shape = (n, n)
+        self.shape = (int(shape[0]), int(shape[1]))
+
+        if len(self.ICL) != len(self.VAL) or self.ROWPTR[-1] != len(self.VAL):
+            raise ValueError('ICL, VAL and ROWPTR lengths do not match')
+
+    def __iter__(self):
+        return iter((self.ICL, self.VAL, self.ROWPTR))
+
+    def __repr__(self):
+        return '<BSRMatrix {}x{}, blocksize={}, blocks={}>'.format(
+            self.shape[0], self.shape[1], self.blocksize, self.nnz_blocks)
+
+    @property
+    def nnz_blocks(self):
+        return len(self.ICL)
+
+    @property
+    def nnz(self):
+        '''stored values, explicit zeros inside the blocks included'''
+        return self.VAL.size
+
+    @property
+    def block_shape(self):
+        return len(self.ROWPTR) - 1, self.shape[1] // self.blocksize
+
+    def block_rows(self):
+        '''block row of every stored block'''
+        return np.repeat(np.arange(len(self.ROWPTR) - 1), np.diff(self.ROWPTR))
+
+    def pattern(self):
+        '''block sparsity pattern as CSRMatrix (block index as values)'''
+        return CSRMatrix(self.ICL, np.arange(self.nnz_blocks, dtype=np.float64), self.ROWPTR,
+                         self.block_shape)
+
+    def to_csr(self, tol=0):
+        '''scalar CSRMatrix, values with abs(val) <= tol are left out'''
+        r = self.blocksize
+        rows = (self.block_rows()[:, None, None] * r + np.arange(r)[None, :, None]).repeat(r, axis=2)
+        cols = (self.ICL[:, None, None] * r + np.arange(r)[None, None, :]).repeat(r, axis=1)
+        keep = np.abs(self.VAL) > tol
+
+        rows, cols, vals = rows[keep], cols[keep], self.VAL[keep]
+        order = np.lexsort((cols, rows))
+        ROWPTR = np.zeros(self.shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=self.shape[0]), out=ROWPTR[1:])
+        return CSRMatrix(cols[order], vals[order], ROWPTR, self.shape)
+
+    def to_dense(self):
+        return self.to_csr().to_dense()
+
+
+def _block_coordinates(matrix, r):
+    ICL, VAL, ROWPTR = matrix
+    ICL = np.asarray(ICL, dtype=np.int64)
+    rows = np.repeat(np.arange(len(ROWPTR) - 1), np.diff(np.asarray(ROWPTR)))
+    return rows, ICL, np.asarray(VAL, dtype=np.float64)
+
+
+def block_fill(matrix, r):
+    '''(stored values in r x r blocks) / nnz - how many explicit zeros
+        the blocking would add, 1.0 means the pattern is exactly blocked'''
+    rows, cols, _ = _block_coordinates(matrix, r)
+    n_block_cols = (int(cols.max()) // r + 1) if len(cols) else 1
+    blocks = np.unique(rows // r * n_block_cols + cols // r)
+    return len(blocks) * r * r / max(len(cols), 1)
+
+
+def detect_block_size(matrix, candidates=(6, 4, 3, 2), max_fill=1.0):
+    '''largest candidate block size dividing the matrix size whose
+        blocking stores at most max_fill times the nonzeros, otherwise 1
+        (max_fill=1.0 only accepts exactly blocked patterns, e.g. vector
+        valued FEM with r degrees of freedom per node)'''
+    n = len(matrix[2]) - 1
+    for r in sorted(candidates, reverse=True):
+        if n % r == 0 and block_fill(matrix, r) <= max_fill:
+            return r
+    return 1
+
+
+def csr_to_bsr(matrix, blocksize=None, max_fill=1.0):
+    '''converts square matrix in CSR format to BSRMatrix,
+        blocksize=None detects it with detect_block_size'''
+    n = len(matrix[2]) - 1
+    if blocksize is None:
+        blocksize = detect_block_size(matrix, max_fill=max_fill)
+    r = blocksize
+    if n % r:
+        raise ValueError('matrix size {} is not divisible by block size {}'.format(n, r))
+
+    rows, cols, vals = _block_coordinates(matrix, r)
+    nb = n // r
+    keys = rows // r * nb + cols // r
+    blocks, index = np.unique(keys, return_inverse=True)
+
+    VAL = np.zeros((len(blocks), r, r))
+    VAL[index, rows % r, cols % r] = vals
+    ROWPTR = np.zeros(nb + 1, dtype=np.int64)
+    np.cumsum(np.bincount(blocks // nb, minlength=nb), out=ROWPTR[1:])
+    return BSRMatrix(blocks % nb, VAL, ROWPTR, r, (n, n))
+
+
+def bsr_matvec(A, X):
+    '''A @ X for BSRMatrix A and dense vector or matrix X (block SpMV / SpMM)
+        every stored block multiplies its r rows of X in one batched matmul,
+        block rows are summed with np.add.reduceat'''
+    X = np.asarray(X, dtype=np.float64)
+    r = A.blocksize
+    vector = X.ndim == 1
+    XB = X.reshape(-1, r, 1 if vector else X.shape[1])
+
+    products = A.VAL @ XB[A.ICL]
+    Y = np.zeros((len(A.ROWPTR) - 1,) + products.shape[1:])
+    starts = A.ROWPTR[:-1]
+    nonempty = starts < A.ROWPTR[1:]
+    if len(products):
+        Y[nonempty] = np.add.reduceat(products, starts[nonempty], axis=0)
+
+    return Y.reshape(-1) if vector else Y.reshape(-1, X.shape[1])
+
+
+def bsr_matmul(A, B):
+    '''A @ B for BSRMatrix A and B with the same block size (block SpGEMM)
+        block pattern of the result comes from matmul_CSR_symbolic, every
+        pair A[i, k], B[k, j] is one r x r product of a batched matmul,
+        products are summed into the result blocks with np.add.at'''
+    if A.blocksize != B.blocksize:
+        raise ValueError('block sizes do not match')
+    ICL_C, ROWPTR_C = matmul_CSR_symbolic(A.pattern(), B.pattern())
+    m = B.block_shape[1]
+
+    # every A block against every block of the B row it hits
+    starts = B.ROWPTR[A.ICL]
+    counts = B.ROWPTR[A.ICL + 1] - starts
+    offsets = np.cumsum(counts) - counts
+    b_index = np.repeat(starts - offsets, counts) + np.arange(counts.sum())
+    a_index = np.repeat(np.arange(A.nnz_blocks), counts)
+
+    c_rows = np.repeat(np.arange(len(ROWPTR_C) - 1), np.diff(ROWPTR_C))
+    c_keys = c_rows * m + ICL_C
+    keys = A.block_rows()[a_index] * m + B.ICL[b_index]
+
+    VAL_C = np.zeros((len(ICL_C), A.blocksize, A.blocksize))
+    np.add.at(VAL_C, np.searchsorted(c_keys, keys), A.VAL[a_index] @ B.VAL[b_index])
+    return BSRMatrix(ICL_C, VAL_C, ROWPTR_C, A.blocksize, (A.shape[0], B.shape[1]))
+
+
+def bsr_cholesky(A):
+    '''returns L.T as BSRMatrix, that (L.T).T @ L.T == A, for symmetric
+        positive definite A stored with both triangles
+        the symbolic analysis runs on the block pattern, the numeric phase
+        is the left-looking factor_rows with r x r blocks instead of scalars:
+        block row k gets U[i, k].T @ U[i, k:] subtracted for every earlier
+        block row i with U[i, k] != 0 (one batched matmul per row i), then
+        U[k, k] = cholesky(X[k]).T and U[k, k+1:] = inv(U[k, k].T) @ X[k+1:]'''
+    r = A.blocksize
+    symbolic = symbolic_cholesky(A.pattern())
+    ICL = symbolic.ICL
+    ROWPTR = symbolic.ROWPTR.tolist()
+    LROWPTR, LIDX, LPOS = symbolic.LROWPTR.tolist(), symbolic.LIDX.tolist(), symbolic.LPOS.tolist()
+    nb = symbolic.n
+
+    VAL = np.zeros((len(ICL), r, r))
+    VAL[symbolic.A_MAP] = A.VAL[symbolic.A_INDEX]
+
+    x = np.zeros((nb, r, r))
+    for k in range(nb):
+        row_start, row_end = ROWPTR[k], ROWPTR[k+1]
+        cols = ICL[row_start:row_end]
+        x[cols] = VAL[row_start:row_end]
+
+        for p in range(LROWPTR[k], LROWPTR[k+1]):
+            position = LPOS[p]
+            i_end = ROWPTR[LIDX[p]+1]
+            x[ICL[position:i_end]] -= VAL[position].T @ VAL[position:i_end]
+
+        try:
+            lower = np.linalg.cholesky(x[k])
+        except np.linalg.LinAlgError:
+            raise ValueError('nonpositive value on diagonal')
+
+        # U[k, j] = inv(L_kk) @ X[j] for all blocks of the row at once
+        rest = x[cols[1:]]
+        VAL[row_start] = lower.T
+        if len(rest):
+            solved = np.linalg.solve(lower, rest.transpose(1, 0, 2).reshape(r, -1))
+            VAL[row_start+1:row_end] = solved.reshape(r, len(rest), r).transpose(1, 0, 2)
+
+    return BSRMatrix(ICL, VAL, symbolic.ROWPTR, r, A.shape)
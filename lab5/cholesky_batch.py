@@ -0,0 +1,119 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from csr_matrix import CSRMatrix
+from ordering import permute_pattern
+from cholesky_supernodal import find_supernodes, supernodal_factor
+from cholesky_solve import CholeskyFactor, cholesky_analysis
+
+
+def numeric_cholesky_batch(VALS, symbolic, SUPERPTR):
+    '''supernodal numeric factorization of a stack of matrices (batch, nnz)
+        sharing the pattern of the symbolic analysis - supernodal_factor
+        with a leading batch axis, returns the values of L.T (batch, nnz(L))'''
+    VALS_U = np.zeros((len(VALS), len(symbolic.ICL)))
+    VALS_U[:, symbolic.A_MAP] = VALS[:, symbolic.A_INDEX]
+    return supernodal_factor(VALS_U, symbolic, SUPERPTR)
+
+
+def _numeric_chunk(arguments):
+    return numeric_cholesky_batch(*arguments)
+
+
+class BatchCholeskyFactor:
+    '''factors of a batch of matrices sharing one pattern:
+        P @ A[b] @ P.T = U[b].T @ U[b] for every b
+        ICL, ROWPTR - common pattern of U = L.T
+        VALS        - values of U for every matrix (batch, nnz(L))
+        permutation - common permutation vector, None for natural
+        symbolic    - the one symbolic analysis'''
+
+    __slots__ = ('ICL', 'ROWPTR', 'VALS', 'permutation', 'symbolic')
+
+    def __init__(self, ICL, ROWPTR, VALS, permutation=None, symbolic=None):
+        self.ICL = ICL
+        self.ROWPTR = ROWPTR
+        self.VALS = VALS
+        self.permutation = None if permutation is None else np.asarray(permutation, dtype=np.int64)
+        self.symbolic = symbolic
+
+    def __len__(self):
+        return len(self.VALS)
+
+    def __repr__(self):
+        return '<BatchCholeskyFactor batch={}, n={}, nnz={}>'.format(
+            len(self), len(self.ROWPTR) - 1, len(self.ICL))
+
+    def __getitem__(self, b):
+        '''factor of a single matrix of the batch as CholeskyFactor'''
+        n = len(self.ROWPTR) - 1
+        U = CSRMatrix(self.ICL, self.VALS[b], self.ROWPTR, (n, n))
+        return CholeskyFactor(U, self.permutation, self.symbolic)
+
+    def solve(self, B):
+        '''X[b] with A[b] @ X[b] = B[b] for every matrix of the batch
+            B has shape (batch, n) or (batch, n, right-hand sides),
+            both triangular solves run over the whole batch at once'''
+        B = np.asarray(B, dtype=np.float64)
+        vector = B.ndim == 2
+        X = B[:, :, None].copy() if vector else B.copy()
+        if self.permutation is not None:
+            X = X[:, self.permutation]
+
+        ICL, ROWPTR, VALS = self.ICL, self.ROWPTR, self.VALS
+        n = len(ROWPTR) - 1
+
+        for k in range(n):
+            start, end = ROWPTR[k], ROWPTR[k+1]
+            X[:, k] /= VALS[:, start, None]
+            X[:, ICL[start+1:end]] -= VALS[:, start+1:end, None] * X[:, k, None]
+
+        for k in range(n - 1, -1, -1):
+            start, end = ROWPTR[k], ROWPTR[k+1]
+            X[:, k] -= np.einsum('bj,bjr->br', VALS[:, start+1:end], X[:, ICL[start+1:end]])
+            X[:, k] /= VALS[:, start, None]
+
+        if self.permutation is not None:
+            result = np.empty_like(X)
+            result[:, self.permutation] = X
+            X = result
+
+        return X[:, :, 0] if vector else X
+
+
+def batch_cholesky(ICL, ROWPTR, VALS, ordering='auto', methods=('natural', 'rcm', 'amd'),
+                   workers=1, chunk_size=None, relax=0.25):
+    '''factors a batch of symmetric positive definite matrices with one CSR
+        pattern (ICL, ROWPTR) and values VALS of shape (batch, nnz)
+        ordering (a name from ORDERINGS, a permutation vector or 'auto'),
+        symbolic analysis and supernode partition are computed once,
+        the numeric factorization runs vectorized over the batch dimension,
+        with workers > 1 chunks of the batch go to a process pool
+        returns BatchCholeskyFactor'''
+    ICL = np.asarray(ICL)
+    ROWPTR = np.asarray(ROWPTR)
+    VALS = np.atleast_2d(np.asarray(VALS, dtype=np.float64))
+    if VALS.shape[1] != len(ICL):
+        raise ValueError('VALS rows have to match the pattern length')
+
+    # ordering and symbolic analysis of the first matrix hold for all of them,
+    # the rest of the batch only needs its values moved the same way
+    permutation, _, symbolic = cholesky_analysis(CSRMatrix(ICL, VALS[0], ROWPTR), ordering, methods)
+    if permutation is not None:
+        _, _, source = permute_pattern(ICL, ROWPTR, permutation)
+        VALS = VALS[:, source]
+
+    SUPERPTR = find_supernodes(symbolic, relax)
+
+    if workers == 1:
+        VALS_U = numeric_cholesky_batch(VALS, symbolic, SUPERPTR)
+    else:
+        if chunk_size is None:
+            chunk_size = -(-len(VALS) // workers)
+        chunks = [(VALS[start:start + chunk_size], symbolic, SUPERPTR)
+                  for start in range(0, len(VALS), chunk_size)]
+        with ProcessPoolExecutor(workers) as pool:
+            VALS_U = np.concatenate(list(pool.map(_numeric_chunk, chunks)))
+
+    return BatchCholeskyFactor(symbolic.ICL, symbolic.ROWPTR, VALS_U, permutation, symbolic)
@@ -0,0 +1,105 @@
+import numpy as np
+
+from csr_matrix import CSRMatrix
+
+
+def _lower_row(ICL, ROWPTR, k):
+    '''columns i < k of row k - for symmetric matrix the same as
+        rows i < k of column k, so no transposed copy of A is needed'''
+    cols = ICL[ROWPTR[k]:ROWPTR[k+1]].tolist()
+    return cols[:np.searchsorted(cols, k)] if cols and cols[-1] >= k else cols
+
+
+def _etree_counts(ICL, ROWPTR, n):
+    '''elimination tree and column counts of L (diagonal included)
+        from the rows of A, only O(n) python lists are allocated'''
+    parent = [-1] * n
+    ancestor = [-1] * n
+    for k in range(n):
+        for i in _lower_row(ICL, ROWPTR, k):
+            while i != -1 and i < k:
+                next_i = ancestor[i]
+                ancestor[i] = k
+                if next_i == -1:
+                    parent[i] = k
+                i = next_i
+
+    colcount = [1] * n
+    mark = [-1] * n
+    for k in range(n):
+        mark[k] = k
+        for i in _lower_row(ICL, ROWPTR, k):
+            while mark[i] != k:
+                colcount[i] += 1
+                mark[i] = k
+                i = parent[i]
+
+    return parent, colcount
+
+
+def sparse_cholesky_inplace(matrix):
+    '''
+        returns L.T matrix as CSRMatrix, that (L.T.)T @ L.T == matrix
+        low memory variant: the exact size of every row of L.T is counted
+        first, then ICL and VAL of the result are allocated once and filled
+        in place by an up-looking factorization - row k of L is the solution
+        of L[:k, :k] @ y = A[:k, k], its nonzeros are appended to the rows
+        of L.T they belong to
+        besides the result only O(n) workspace is used (etree, row pointers,
+        dense vector x), the matrix has to be stored with both triangles
+    '''
+    ICL_A, VAL_A, ROWPTR_A = matrix
+    ICL_A = np.asarray(ICL_A)
+    VAL_A = np.asarray(VAL_A, dtype=np.float64)
+    ROWPTR_A = np.asarray(ROWPTR_A)
+    n = len(ROWPTR_A) - 1
+
+    parent, colcount = _etree_counts(ICL_A, ROWPTR_A, n)
+
+    ROWPTR = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(colcount, out=ROWPTR[1:])
+    nnz = int(ROWPTR[-1])
+    ICL = np.empty(nnz, dtype=np.int32 if nnz < np.iinfo(np.int32).max else np.int64)
+    VAL = np.empty(nnz)
+    row_start = ROWPTR[:-1].tolist()
+    next_free = list(row_start)
+
+    x = np.zeros(n)
+    mark = [-1] * n
+    for k in range(n):
+        a_start, a_end = ROWPTR_A[k], ROWPTR_A[k+1]
+        cols = ICL_A[a_start:a_end]
+        lower = cols <= k
+        x[cols[lower]] = VAL_A[a_start:a_end][lower]
+
+        # structure of row k of L - the row subtree of the etree
+        mark[k] = k
+        nodes = []
+        for i in _lower_row(ICL_A, ROWPTR_A, k):
+            while mark[i] != k:
+                nodes.append(i)
+                mark[i] = k
+                i = parent[i]
+        nodes.sort()
+
+        dkk = x[k]
+        x[k] = 0
+        for i in nodes:
+            start, end = row_start[i], next_free[i]
+            y = x[i] / VAL[start]
+            x[i] = 0
+            # row i of L.T is filled up to column k - 1 so far
+            x[ICL[start+1:end]] -= VAL[start+1:end] * y
+            dkk -= y * y
+            ICL[end] = k
+            VAL[end] = y
+            next_free[i] += 1
+
+        if dkk <= 0:
+            raise ValueError('nonpositive value on diagonal')
+
+        ICL[next_free[k]] = k
+        VAL[next_free[k]] = dkk ** 0.5
+        next_free[k] += 1
+
+    return CSRMatrix(ICL, VAL, ROWPTR, (n, n))
@@ -0,0 +1,178 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+from time import time
+
+import numpy as np
+
+from csr_matrix import CSRMatrix
+from cholesky_symbolic import symbolic_cholesky, factor_rows, initial_values
+
+
+def row_costs(symbolic):
+    '''approximate work of computing every row of L.T -
+        number of multiply-subtract operations of the updates it receives'''
+    ROWPTR = symbolic.ROWPTR.astype(np.int64)
+    lengths = ROWPTR[symbolic.LIDX.astype(np.int64) + 1] - symbolic.LPOS
+    rows = np.repeat(np.arange(symbolic.n), np.diff(symbolic.LROWPTR))
+    return np.bincount(rows, weights=lengths, minlength=symbolic.n) + np.diff(ROWPTR)
+
+
+def split_subtrees(symbolic, workers, granularity=4):
+    '''splits the elimination tree into independent subtrees for the workers
+        the heaviest subtree is replaced by its children (its root goes
+        to the top part) until there are granularity * workers subtrees
+        or no subtree is heavier than 1 / (granularity * workers) of all work
+        subtrees are assigned to workers largest first, to the least loaded one
+        returns (rows of every worker, rows of the top part), all sorted'''
+    n = symbolic.n
+    parent = symbolic.parent
+    cost = row_costs(symbolic)
+
+    # parent > child, so one pass in increasing order sums subtrees up
+    subtree_cost = cost.copy()
+    children = [[] for _ in range(n)]
+    roots = []
+    for k in range(n):
+        if parent[k] >= 0:
+            subtree_cost[parent[k]] += subtree_cost[k]
+            children[parent[k]].append(k)
+        else:
+            roots.append(k)
+
+    limit = subtree_cost[roots].sum() / (granularity * workers)
+    frontier = list(roots)
+    top = np.zeros(n, dtype=bool)
+    while frontier and len(frontier) < granularity * workers:
+        heaviest = max(frontier, key=lambda k: subtree_cost[k])
+        if subtree_cost[heaviest] <= limit:
+            break
+        frontier.remove(heaviest)
+        frontier.extend(children[heaviest])
+        top[heaviest] = True
+
+    # every node gets the frontier subtree it belongs to, top nodes get -1
+    label = np.full(n, -1, dtype=np.int64)
+    label[frontier] = frontier
+    for k in range(n - 1, -1, -1):
+        if label[k] < 0 and not top[k] and parent[k] >= 0:
+            label[k] = label[parent[k]]
+
+    load = np.zeros(workers)
+    owner = np.full(n, -1, dtype=np.int64)
+    for root in sorted(frontier, key=lambda k: -subtree_cost[k]):
+        worker = int(np.argmin(load))
+        load[worker] += subtree_cost[root]
+        owner[root] = worker
+
+    node_owner = np.where(label >= 0, owner[np.maximum(label, 0)], -1)
+    worker_rows = [np.flatnonzero(node_owner == w) for w in range(workers)]
+    return worker_rows, np.flatnonzero(node_owner < 0)
+
+
+def _share(array):
+    '''copy of the array in shared memory, returns (shared memory, array view)'''
+    memory = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    view = np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)
+    view[:] = array
+    return memory, view
+
+
+_worker_arrays = {}
+
+
+def _attach(descriptions):
+    # process pool initializer - maps the shared factor arrays once per worker
+    for name, (memory_name, shape, dtype) in descriptions.items():
+        memory = shared_memory.SharedMemory(name=memory_name)
+        _worker_arrays[name] = (memory, np.ndarray(shape, dtype=dtype, buffer=memory.buf))
+
+    arrays = {name: view for name, (_, view) in _worker_arrays.items()}
+    _worker_arrays['lists'] = [arrays[name].tolist() for name in ('ROWPTR', 'LROWPTR', 'LIDX', 'LPOS')]
+
+
+def _factor_shared_rows(rows):
+    ICL = _worker_arrays['ICL'][1]
+    VAL = _worker_arrays['VAL'][1]
+    ROWPTR, LROWPTR, LIDX, LPOS = _worker_arrays['lists']
+    factor_rows(rows.tolist(), ICL, VAL, ROWPTR, LROWPTR, LIDX, LPOS, np.zeros(len(ROWPTR) - 1))
+
+
+def numeric_cholesky_parallel(matrix, symbolic, workers=2, executor=None):
+    '''returns L.T matrix as CSRMatrix, that (L.T.)T @ L.T == matrix
+        rows of disjoint elimination tree subtrees do not depend on each other,
+        so every worker factors its own subtrees (split_subtrees) directly in
+        the shared VAL array, then the top part of the tree (separators) is
+        factored in this process once all workers are done
+        executor=None factors the subtrees one after another in this process
+        (no pool is started), 'process' uses shared memory and a process pool,
+        'thread' a thread pool on the same arrays (cheaper to start, but
+        shares the GIL)'''
+    n = symbolic.n
+    VAL = initial_values(matrix, symbolic)
+    worker_rows, top_rows = split_subtrees(symbolic, workers)
+    lists = (symbolic.ROWPTR.tolist(), symbolic.LROWPTR.tolist(),
+             symbolic.LIDX.tolist(), symbolic.LPOS.tolist())
+
+    if executor is None:
+        for rows in worker_rows:
+            factor_rows(rows.tolist(), symbolic.ICL, VAL, *lists, np.zeros(n))
+
+    elif executor == 'thread':
+        with ThreadPoolExecutor(workers) as pool:
+            futures = [pool.submit(factor_rows, rows.tolist(), symbolic.ICL, VAL, *lists, np.zeros(n))
+                       for rows in worker_rows if len(rows)]
+            for future in futures:
+                future.result()
+
+    elif executor == 'process':
+        shared = {
+            'ICL': _share(symbolic.ICL),
+            'VAL': _share(VAL),
+            'ROWPTR': _share(symbolic.ROWPTR),
+            'LROWPTR': _share(symbolic.LROWPTR),
+            'LIDX': _share(symbolic.LIDX),
+            'LPOS': _share(symbolic.LPOS),
+        }
+        try:
+            descriptions = {name: (memory.name, view.shape, view.dtype)
+                            for name, (memory, view) in shared.items()}
+            with ProcessPoolExecutor(workers, initializer=_attach, initargs=(descriptions,)) as pool:
+                futures = [pool.submit(_factor_shared_rows, rows) for rows in worker_rows if len(rows)]
+                for future in futures:
+                    future.result()
+            VAL = shared['VAL'][1].copy()
+        finally:
+            for memory, _ in shared.values():
+                memory.close()
+                memory.unlink()
+
+    else:
+        raise ValueError('unknown executor {}'.format(executor))
+
+    factor_rows(top_rows.tolist(), symbolic.ICL, VAL, *lists, np.zeros(n))
+    return CSRMatrix(symbolic.ICL, VAL, symbolic.ROWPTR, (n, n))
+
+
+def sparse_cholesky_parallel(matrix, symbolic=None, workers=2, executor=None):
+    '''parallel sparse Cholesky, the same interface as sparse_cholesky_symbolic
+        returns (L.T as CSRMatrix, symbolic)'''
+    if symbolic is None:
+        symbolic = symbolic_cholesky(matrix)
+    return numeric_cholesky_parallel(matrix, symbolic, workers, executor), symbolic
+
+
+def parallel_speedup(matrix, workers=(1, 2, 4), executor='process', symbolic=None):
+    '''times the numeric factorization for every worker count,
+        returns {workers: (time [s], speedup against the first worker count)}
+        there is no speedup beyond the number of cpus (os.cpu_count())'''
+    if symbolic is None:
+        symbolic = symbolic_cholesky(matrix)
+
+    times = {}
+    for count in workers:
+        start = time()
+        numeric_cholesky_parallel(matrix, symbolic, count, executor)
+        times[count] = time() - start
+
+    base = times[workers[0]]
+    return {count: (elapsed, base / elapsed) for count, elapsed in times.items()}
@@ -1,5 +1,9 @@
 from itertools import chain
 
+from csr_matrix import CSRMatrix, as_lists
+from ordering import permute_symmetric, select_ordering
+
+
 def rowptr_from_list(val_list):
     ROWPTR = []
     counter = 0
@@ -13,11 +17,10 @@ def sparse_cholesky_permutation(matrix, permutation):
     '''
         returns L.T matrix in CSR format
         that (L.T.)T @ L.T == matrix
+        for CSRMatrix input the result is CSRMatrix as well
     '''
 
-    ICL = matrix[0][:]
-    VAL = matrix[1][:]
-    ROWPTR = matrix[2][:]
+    ICL, VAL, ROWPTR = as_lists(matrix)
     
     n = len(ROWPTR) - 1
     
@@ -171,6 +174,27 @@ def sparse_cholesky_permutation(matrix, permutation):
         ICL = list(chain.from_iterable(icl_list))
         VAL = list(chain.from_iterable(val_list))
 
+    if isinstance(matrix, CSRMatrix):
+        return CSRMatrix(ICL, VAL, ROWPTR, matrix.shape)
     return ICL, VAL, ROWPTR
 
 
+def sparse_cholesky_relabelled(matrix, permutation):
+    '''
+        returns L.T matrix of P @ matrix @ P.T in CSR format
+        the matrix is relabelled with permute_symmetric in O(nnz),
+        so the elimination runs in natural order and rows
+        of the result are already in the permuted order
+    '''
+    permuted = permute_symmetric(matrix, permutation)
+    return sparse_cholesky_permutation(permuted, list(range(len(permutation))))
+
+
+def sparse_cholesky_auto(matrix, methods=('natural', 'rcm', 'amd')):
+    '''
+        predicts the fill-in of every ordering from methods,
+        factors with the cheapest one
+        returns (L.T of P @ matrix @ P.T in CSR format, permutation)
+    '''
+    _, permutation, _ = select_ordering(matrix, methods)
+    return sparse_cholesky_relabelled(matrix, permutation), permutation
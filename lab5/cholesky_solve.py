@@ -0,0 +1,144 @@
+from time import time
+
+import numpy as np
+
+from ordering import ORDERINGS, permute_symmetric, select_ordering
+from cholesky_symbolic import symbolic_cholesky
+from cholesky_supernodal import numeric_cholesky_supernodal
+
+
+def _check_factor(U):
+    ICL, VAL, ROWPTR = U
+    n = len(ROWPTR) - 1
+    if n and not np.array_equal(np.asarray(ICL)[np.asarray(ROWPTR[:-1])], np.arange(n)):
+        raise ValueError('factor has to be upper triangular with the diagonal first in every row')
+
+
+def solve_lower(U, B):
+    '''solves L @ X = B, where U = L.T is the factor in CSR format
+        row k of U is column k of L, so after X[k] is known it is
+        subtracted from all later rows it touches (column oriented
+        forward substitution - no transposition of U needed)
+        B is one vector or a matrix with the right-hand sides as columns,
+        X is computed in the precision of the factor values'''
+    _check_factor(U)
+    ICL, VAL, ROWPTR = U
+    X = np.array(B, dtype=np.asarray(VAL).dtype)
+
+    for k in range(len(ROWPTR) - 1):
+        start, end = ROWPTR[k], ROWPTR[k+1]
+        X[k] /= VAL[start]
+        X[ICL[start+1:end]] -= np.multiply.outer(VAL[start+1:end], X[k])
+
+    return X
+
+
+def solve_upper(U, B):
+    '''solves U @ X = B, where U = L.T is the factor in CSR format
+        row oriented back substitution - X[k] needs the dot product of
+        row k of U with the already known X[k+1:]'''
+    _check_factor(U)
+    ICL, VAL, ROWPTR = U
+    X = np.array(B, dtype=np.asarray(VAL).dtype)
+
+    for k in range(len(ROWPTR) - 2, -1, -1):
+        start, end = ROWPTR[k], ROWPTR[k+1]
+        X[k] = (X[k] - VAL[start+1:end] @ X[ICL[start+1:end]]) / VAL[start]
+
+    return X
+
+
+def cholesky_solve(U, B):
+    '''solves A @ X = B for A = U.T @ U, U = L.T in CSR format'''
+    return solve_upper(U, solve_lower(U, B))
+
+
+class CholeskyFactor:
+    '''factor of P @ A @ P.T = U.T @ U, kept to solve for many right-hand sides
+        U           - L.T as CSRMatrix
+        permutation - permutation vector (permutation[new] = old), None for natural
+        symbolic    - symbolic analysis of the permuted matrix'''
+
+    __slots__ = ('U', 'permutation', 'symbolic')
+
+    def __init__(self, U, permutation=None, symbolic=None):
+        self.U = U
+        self.permutation = None if permutation is None else np.asarray(permutation, dtype=np.int64)
+        self.symbolic = symbolic
+
+    def __repr__(self):
+        return '<CholeskyFactor n={}, nnz={}>'.format(self.U.shape[0], self.U.nnz)
+
+    def solve(self, B):
+        '''X with A @ X = B, B is one vector or right-hand sides as columns'''
+        B = np.asarray(B, dtype=np.float64)
+        if self.permutation is None:
+            return cholesky_solve(self.U, B)
+
+        Z = cholesky_solve(self.U, B[self.permutation])
+        X = np.empty_like(Z)
+        X[self.permutation] = Z
+        return X
+
+
+def cholesky_analysis(matrix, ordering='auto', methods=('natural', 'rcm', 'amd')):
+    '''ordering and symbolic phase of cholesky_factor,
+        returns (permutation or None, permuted matrix, symbolic)'''
+    if isinstance(ordering, str):
+        if ordering == 'auto':
+            _, permutation, _ = select_ordering(matrix, methods)
+        elif ordering == 'natural':
+            permutation = None
+        else:
+            permutation = ORDERINGS[ordering](matrix)
+    else:
+        permutation = ordering
+
+    if permutation is not None:
+        matrix = permute_symmetric(matrix, permutation)
+
+    return permutation, matrix, symbolic_cholesky(matrix)
+
+
+def cholesky_factor(matrix, ordering='auto', methods=('natural', 'rcm', 'amd'), dtype=np.float64):
+    '''factors the symmetric positive definite matrix in CSR format once,
+        ordering is a name from ORDERINGS, a permutation vector, or 'auto'
+        to pick the cheapest of methods with select_ordering
+        numeric phase is the supernodal one in dtype precision
+        (see mixed_precision for float32), returns CholeskyFactor'''
+    permutation, matrix, symbolic = cholesky_analysis(matrix, ordering, methods)
+    U = numeric_cholesky_supernodal(matrix, symbolic, dtype=dtype)
+    return CholeskyFactor(U, permutation, symbolic)
+
+
+def solve(A, B, ordering='auto', factor=None):
+    '''solves A @ X = B for symmetric positive definite A in CSR format,
+        B is one vector or a matrix with many right-hand sides as columns
+        A is factored once for all of them, pass factor (from cholesky_factor
+        or a previous call) to skip the factorization
+        returns (X, factor)'''
+    if factor is None:
+        factor = cholesky_factor(A, ordering)
+    return factor.solve(B), factor
+
+
+def solve_throughput(A, n_rhs=(1, 8, 64), repeats=5, ordering='auto'):
+    '''factors A once, then times the solves for blocks of n_rhs random
+        right-hand sides (best of repeats)
+        returns {'factor': time [s], n_rhs: (time [s], solves / s)}'''
+    n = len(A[2]) - 1
+    start = time()
+    factor = cholesky_factor(A, ordering)
+    results = {'factor': time() - start}
+
+    generator = np.random.default_rng(0)
+    for count in n_rhs:
+        B = generator.standard_normal((n, count))
+        best = float('inf')
+        for _ in range(repeats):
+            start = time()
+            factor.solve(B)
+            best = min(best, time() - start)
+        results[count] = (best, count / best)
+
+    return results
@@ -0,0 +1,154 @@
+import numpy as np
+
+from csr_matrix import CSRMatrix
+from cholesky_symbolic import symbolic_cholesky, initial_values
+
+
+def find_supernodes(symbolic, relax=0.0):
+    '''splits columns into fundamental supernodes - runs of consecutive
+        columns j, j+1 where j+1 is the parent of j and column j of L has
+        exactly one nonzero more than column j+1, so they share the structure
+        with relax > 0 a supernode is also merged into the next one if it is
+        its parent in the etree and at most relax fraction of the merged block
+        would be explicit zeros (relaxed amalgamation, fewer but bigger blocks)
+        returns SUPERPTR, supernode s covers columns SUPERPTR[s]:SUPERPTR[s+1]'''
+    parent = symbolic.parent
+    colcount = symbolic.colcount
+    n = symbolic.n
+
+    # number of children in the etree, a column with more than one child starts a new supernode
+    children = np.bincount(parent[parent >= 0], minlength=n)
+
+    j = np.arange(n - 1)
+    continues = (parent[:-1] == j + 1) & (colcount[:-1] == colcount[1:] + 1) & (children[1:] == 1)
+    SUPERPTR = np.append(np.flatnonzero(np.concatenate(([True], ~continues))), n)
+
+    if relax <= 0:
+        return SUPERPTR
+
+    merged = [0]
+    nonzeros = colcount[0]
+    for s in range(1, len(SUPERPTR) - 1):
+        first, next_first, next_last = merged[-1], SUPERPTR[s], SUPERPTR[s+1]
+        width = next_last - first
+        size = (next_first - first) + colcount[next_first]
+        total = width * size - width * (width - 1) // 2
+        next_nonzeros = nonzeros + colcount[next_first:next_last].sum()
+
+        if parent[next_first - 1] == next_first and total - next_nonzeros <= relax * total:
+            nonzeros = next_nonzeros
+        else:
+            merged.append(next_first)
+            nonzeros = colcount[next_first:next_last].sum()
+
+    return np.append(merged, n)
+
+
+def _supernode_structure(symbolic, first, last):
+    '''columns of the supernode followed by the structure of its last column,
+        for a fundamental supernode it is just the structure of the first column'''
+    row = symbolic.ICL[symbolic.ROWPTR[last-1]:symbolic.ROWPTR[last]]
+    return np.concatenate((np.arange(first, last - 1, dtype=row.dtype), row))
+
+
+def _partial_cholesky(block, width):
+    '''LLT-style vectorized elimination of the first width pivots of block,
+        whose rows are rows of L.T: block[..., k, k:] holds U[k, k:]
+        only the upper triangle of the diagonal part is meaningful
+        leading axes (a batch of blocks) are eliminated all at once'''
+    if block.ndim > 2:
+        for k in range(width):
+            if np.any(block[..., k, k] <= 0):
+                raise ValueError('nonpositive value on diagonal')
+            block[..., k, k] **= 0.5
+            block[..., k, k+1:] /= block[..., k, k, None]
+            block[..., k+1:width, k+1:] -= block[..., k, k+1:width, None] * block[..., k, None, k+1:]
+        return
+
+    # a single block - scalar pivots are cheaper than the broadcasting above
+    for k in range(width):
+        if block[k, k] <= 0:
+            raise ValueError('nonpositive value on diagonal')
+        block[k, k] **= 0.5
+        block[k, k+1:] /= block[k, k]
+        block[k+1:width, k+1:] -= np.outer(block[k, k+1:width], block[k, k+1:])
+
+
+def supernodal_factor(VAL, symbolic, SUPERPTR):
+    '''numeric phase on the values of L.T with A already scattered in
+        (initial_values), in place, VAL has shape (nnz(L),) or (..., nnz(L))
+        for a batch of matrices sharing the pattern - then every block gets the
+        leading axes, so each step is one numpy call for the whole batch
+        every supernode is kept as one dense block (its rows of L.T restricted
+        to the shared structure), factored with the dense kernel, and its update
+        to the rest of the matrix is one product S.T @ S of the off-diagonal
+        part, subtracted block-wise from the supernodes it touches'''
+    ICL = symbolic.ICL
+    ROWPTR = symbolic.ROWPTR
+    n_super = len(SUPERPTR) - 1
+    batch = VAL.shape[:-1]
+
+    column_super = np.repeat(np.arange(n_super), np.diff(SUPERPTR))
+    structures = []
+    blocks = []
+    for s in range(n_super):
+        first, last = SUPERPTR[s], SUPERPTR[s+1]
+        structure = _supernode_structure(symbolic, first, last)
+        block = np.zeros(batch + (last - first, len(structure)), dtype=VAL.dtype)
+        for local, j in enumerate(range(first, last)):
+            positions = np.searchsorted(structure, ICL[ROWPTR[j]:ROWPTR[j+1]])
+            block[..., local, positions] = VAL[..., ROWPTR[j]:ROWPTR[j+1]]
+        structures.append(structure)
+        blocks.append(block)
+
+    for s in range(n_super):
+        block = blocks[s]
+        width = block.shape[-2]
+        _partial_cholesky(block, width)
+
+        targets = structures[s][width:]
+        if len(targets) == 0:
+            continue
+
+        off_diagonal = block[..., width:]
+        update = off_diagonal.swapaxes(-1, -2) @ off_diagonal
+
+        # rows of the update grouped by the supernode they belong to
+        target_super = column_super[targets]
+        group_starts = np.flatnonzero(np.diff(target_super, prepend=-1))
+        group_ends = np.append(group_starts[1:], len(targets))
+
+        for a0, a1 in zip(group_starts, group_ends):
+            t = target_super[a0]
+            rows = targets[a0:a1] - SUPERPTR[t]
+            positions = np.searchsorted(structures[t], targets[a0:])
+            blocks[t][(Ellipsis,) + np.ix_(rows, positions)] -= update[..., a0:a1, a0:]
+
+    for s in range(n_super):
+        first, last = SUPERPTR[s], SUPERPTR[s+1]
+        for local, j in enumerate(range(first, last)):
+            positions = np.searchsorted(structures[s], ICL[ROWPTR[j]:ROWPTR[j+1]])
+            VAL[..., ROWPTR[j]:ROWPTR[j+1]] = blocks[s][..., local, positions]
+
+    return VAL
+
+
+def numeric_cholesky_supernodal(matrix, symbolic, SUPERPTR=None, relax=0.25, dtype=np.float64):
+    '''returns L.T matrix as CSRMatrix, that (L.T.)T @ L.T == matrix,
+        with the supernodes of find_supernodes factored by supernodal_factor
+        dtype=np.float32 factors in single precision (half of the memory traffic)'''
+    if SUPERPTR is None:
+        SUPERPTR = find_supernodes(symbolic, relax)
+
+    n = symbolic.n
+    VAL = initial_values(matrix, symbolic).astype(dtype, copy=False)
+    supernodal_factor(VAL, symbolic, SUPERPTR)
+    return CSRMatrix(symbolic.ICL, VAL, symbolic.ROWPTR, (n, n), dtype=dtype)
+
+
+def sparse_cholesky_supernodal(matrix, symbolic=None, relax=0.25, dtype=np.float64):
+    '''supernodal sparse Cholesky, the same interface as sparse_cholesky_symbolic
+        returns (L.T as CSRMatrix, symbolic)'''
+    if symbolic is None:
+        symbolic = symbolic_cholesky(matrix)
+    return numeric_cholesky_supernodal(matrix, symbolic, relax=relax, dtype=dtype), symbolic
@@ -0,0 +1,241 @@
+import numpy as np
+
+from csr_matrix import CSRMatrix
+
+
+def upper_columns(matrix):
+    '''for every column k, indices i < k of nonzero values A[i, k]
+        (strict upper triangle stored by columns), returned as (IRN, COLPTR)
+        only the upper triangle is read, so both full symmetric
+        and upper triangular input is fine'''
+    ICL, VAL, ROWPTR = matrix
+    n = len(ROWPTR) - 1
+    ICL = np.asarray(ICL)
+    rows = np.repeat(np.arange(n), np.diff(ROWPTR))
+    upper = ICL > rows
+
+    cols, rows = ICL[upper], rows[upper]
+    order = np.argsort(cols, kind='stable')
+    COLPTR = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(cols, minlength=n), out=COLPTR[1:])
+
+    return rows[order], COLPTR
+
+
+def elimination_tree(matrix):
+    '''parent[k] of every node in the elimination tree, -1 for roots
+        Liu's algorithm with path compression, O(nnz * alpha(n))'''
+    IRN, COLPTR = upper_columns(matrix)
+    IRN, COLPTR = IRN.tolist(), COLPTR.tolist()
+    n = len(COLPTR) - 1
+
+    parent = [-1] * n
+    ancestor = [-1] * n
+
+    for k in range(n):
+        for p in range(COLPTR[k], COLPTR[k+1]):
+            i = IRN[p]
+            # climb from i to the root of its current subtree,
+            # pointing every visited node straight at k
+            while i != -1 and i < k:
+                next_i = ancestor[i]
+                ancestor[i] = k
+                if next_i == -1:
+                    parent[i] = k
+                i = next_i
+
+    return np.array(parent, dtype=np.int64)
+
+
+def _row_subtrees(IRN, COLPTR, parent):
+    '''yields (k, nodes of row k of L - without k)
+        nodes are found by climbing the etree from every A[i, k] until
+        a node already marked in this row'''
+    n = len(parent)
+    mark = [-1] * n
+
+    for k in range(n):
+        mark[k] = k
+        nodes = []
+        for p in range(COLPTR[k], COLPTR[k+1]):
+            i = IRN[p]
+            while mark[i] != k:
+                nodes.append(i)
+                mark[i] = k
+                i = parent[i]
+        yield k, nodes
+
+
+def column_counts(matrix, parent=None):
+    '''nonzeros in every column of L (diagonal included) and in every row
+        of L (diagonal excluded), without building the structure itself
+        returns (colcount, rowcount)'''
+    if parent is None:
+        parent = elimination_tree(matrix)
+    IRN, COLPTR = upper_columns(matrix)
+    n = len(COLPTR) - 1
+
+    colcount = np.ones(n, dtype=np.int64)
+    rowcount = np.zeros(n, dtype=np.int64)
+    for k, nodes in _row_subtrees(IRN.tolist(), COLPTR.tolist(), parent.tolist()):
+        rowcount[k] = len(nodes)
+        colcount[nodes] += 1
+
+    return colcount, rowcount
+
+
+def cholesky_flops(colcount):
+    '''floating point operations of the factorization with given column counts:
+        column j takes colcount[j]**2 (division, multiplications and subtractions
+        of the updates it sends to the later columns)'''
+    counts = np.asarray(colcount, dtype=np.float64)
+    return float(np.sum(counts * counts))
+
+
+class SymbolicFactor:
+    '''structure of L.T = U in CSR format, computed once for a sparsity pattern
+        parent       - elimination tree
+        ICL, ROWPTR  - exact nonzero pattern of U (rows of U = columns of L)
+        colcount     - nonzeros in every column of L (diagonal included)
+        LROWPTR, LIDX, LPOS - for every row k of L: columns i < k with L[k, i] != 0
+                              and position of U[i, k] in U's VAL
+        A_ICL, A_ROWPTR - pattern the analysis was made for
+        A_INDEX, A_MAP  - upper triangular values of A and their position in U'''
+
+    __slots__ = ('n', 'parent', 'ICL', 'ROWPTR', 'colcount', 'LROWPTR', 'LIDX', 'LPOS',
+                 'A_ICL', 'A_ROWPTR', 'A_INDEX', 'A_MAP')
+
+    @property
+    def nnz(self):
+        return len(self.ICL)
+
+    @property
+    def flops(self):
+        '''floating point operations of the numeric factorization'''
+        return cholesky_flops(self.colcount)
+
+    def matches(self, matrix):
+        ICL, _, ROWPTR = matrix
+        return np.array_equal(self.A_ROWPTR, ROWPTR) and np.array_equal(self.A_ICL, ICL)
+
+
+def symbolic_cholesky(matrix):
+    '''elimination tree, column counts and exact pattern of L.T
+        the result only depends on the sparsity pattern of the matrix,
+        so it can be reused for every matrix with the same pattern'''
+    ICL, _, ROWPTR = matrix
+    ICL = np.asarray(ICL)
+    ROWPTR = np.asarray(ROWPTR)
+    n = len(ROWPTR) - 1
+
+    parent = elimination_tree(matrix)
+    IRN, COLPTR = upper_columns(matrix)
+    IRN, COLPTR, parent_list = IRN.tolist(), COLPTR.tolist(), parent.tolist()
+
+    # first pass - only column counts
+    colcount, lrow_counts = column_counts(matrix, parent)
+
+    U_ROWPTR = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(colcount, out=U_ROWPTR[1:])
+    LROWPTR = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(lrow_counts, out=LROWPTR[1:])
+
+    # second pass - fill preallocated arrays
+    # rows of U get columns appended in increasing k, so they come out sorted
+    U_ICL = np.empty(U_ROWPTR[-1], dtype=np.int32)
+    LIDX = np.empty(LROWPTR[-1], dtype=np.int32)
+    LPOS = np.empty(LROWPTR[-1], dtype=np.int64)
+    next_free = U_ROWPTR[:-1].tolist()
+    for k, nodes in _row_subtrees(IRN, COLPTR, parent_list):
+        lstart = LROWPTR[k]
+        for offset, i in enumerate(nodes):
+            position = next_free[i]
+            U_ICL[position] = k
+            LIDX[lstart + offset] = i
+            LPOS[lstart + offset] = position
+            next_free[i] += 1
+        U_ICL[next_free[k]] = k
+        next_free[k] += 1
+
+    # where every upper triangular value of A lands in U
+    rows = np.repeat(np.arange(n, dtype=np.int64), np.diff(ROWPTR))
+    A_INDEX = np.flatnonzero(ICL >= rows)
+    u_rows = np.repeat(np.arange(n, dtype=np.int64), colcount)
+    U_keys = u_rows * n + U_ICL
+    A_MAP = np.searchsorted(U_keys, rows[A_INDEX] * n + ICL[A_INDEX])
+
+    symbolic = SymbolicFactor()
+    symbolic.n = n
+    symbolic.parent = parent
+    symbolic.ICL = U_ICL
+    symbolic.ROWPTR = U_ROWPTR.astype(np.int32) if U_ROWPTR[-1] < np.iinfo(np.int32).max else U_ROWPTR
+    symbolic.colcount = colcount
+    symbolic.LROWPTR = LROWPTR
+    symbolic.LIDX = LIDX
+    symbolic.LPOS = LPOS
+    symbolic.A_ICL = ICL.copy()
+    symbolic.A_ROWPTR = ROWPTR.copy()
+    symbolic.A_INDEX = A_INDEX
+    symbolic.A_MAP = A_MAP
+    return symbolic
+
+
+def factor_rows(rows, ICL, VAL, ROWPTR, LROWPTR, LIDX, LPOS, x):
+    '''computes the given rows of L.T in place in VAL
+        VAL has to hold the values of A scattered into the pattern, and every
+        row has to come after its descendants in the elimination tree
+        ROWPTR, LROWPTR, LIDX and LPOS are python lists (faster scalar access),
+        x is a dense work vector of size n'''
+    for k in rows:
+        row_start = ROWPTR[k]
+        row_end = ROWPTR[k+1]
+        cols = ICL[row_start:row_end]
+        x[cols] = VAL[row_start:row_end]
+
+        for p in range(LROWPTR[k], LROWPTR[k+1]):
+            position = LPOS[p]
+            i_end = ROWPTR[LIDX[p]+1]
+            # row i from column k onwards, its pattern is a subset of row k
+            x[ICL[position:i_end]] -= VAL[position] * VAL[position:i_end]
+
+        if x[k] <= 0:
+            raise ValueError('nonpositive value on diagonal')
+
+        dkk = x[k] ** 0.5
+        VAL[row_start:row_end] = x[cols] / dkk
+        VAL[row_start] = dkk
+
+
+def initial_values(matrix, symbolic):
+    '''values of A scattered into the pattern of L.T, zeros in the fill-in'''
+    if not symbolic.matches(matrix):
+        raise ValueError('matrix has different sparsity pattern than the symbolic analysis')
+
+    VAL = np.zeros(len(symbolic.ICL))
+    VAL[symbolic.A_MAP] = np.asarray(matrix[1])[symbolic.A_INDEX]
+    return VAL
+
+
+def numeric_cholesky(matrix, symbolic):
+    '''returns L.T matrix as CSRMatrix, that (L.T.)T @ L.T == matrix,
+        filling the arrays preallocated from the symbolic analysis
+        row k of L.T is computed from A[k, k:] minus U[i, k] * U[i, k:]
+        for every earlier row i with U[i, k] != 0 (known from the analysis),
+        using dense work vector x for the scatter / gather'''
+    n = symbolic.n
+    VAL = initial_values(matrix, symbolic)
+
+    factor_rows(range(n), symbolic.ICL, VAL, symbolic.ROWPTR.tolist(), symbolic.LROWPTR.tolist(),
+                symbolic.LIDX.tolist(), symbolic.LPOS.tolist(), np.zeros(n))
+
+    return CSRMatrix(symbolic.ICL, VAL, symbolic.ROWPTR, (n, n))
+
+
+def sparse_cholesky_symbolic(matrix, symbolic=None):
+    '''sparse Cholesky split into symbolic and numeric phase
+        pass symbolic from a previous call (or symbolic_cholesky) to skip
+        the analysis for matrices sharing the sparsity pattern
+        returns (L.T as CSRMatrix, symbolic)'''
+    if symbolic is None:
+        symbolic = symbolic_cholesky(matrix)
+    return numeric_cholesky(matrix, symbolic), symbolic
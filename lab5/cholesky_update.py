@@ -0,0 +1,170 @@
+import heapq
+from time import time
+
+import numpy as np
+
+from csr_matrix import CSRMatrix
+from matrix_io import coo_to_csr
+from cholesky_solve import CholeskyFactor, cholesky_factor
+
+
+def _rank_update(U, W, sign):
+    '''U = L.T of U.T @ U + sign * W @ W.T, W of shape (n, k)
+        only rows of U where some column of W is nonzero when they are reached
+        change - the path of the nonzeros of W up the elimination tree
+        row k gets the rotations of all columns of W at once: with d = U[k, k],
+        r = sqrt(d^2 + sign * w[k]^2), c = r / d, s = w[k] / d
+            U[k, k] = r, U[k, j] = (U[k, j] + sign * s * w[j]) / c,
+            w[j] = c * w[j] - s * U[k, j]  for j > k
+        entries of w outside the row pattern are new fill of that row
+        returns (ICL, VAL, ROWPTR), the same arrays if there is no fill'''
+    ICL, VAL, ROWPTR = U
+    ICL = np.asarray(ICL)
+    VAL = np.array(VAL, dtype=np.result_type(np.asarray(VAL).dtype, np.float32))
+    ROWPTR = np.asarray(ROWPTR)
+    n = len(ROWPTR) - 1
+
+    W = np.array(W, dtype=np.float64).reshape(n, -1)
+    nonzero = np.flatnonzero(np.any(W != 0, axis=1))
+    pending = nonzero.tolist()
+    heapq.heapify(pending)
+    queued = set(pending)
+    filled = {}
+
+    while pending:
+        k = heapq.heappop(pending)
+        start, end = ROWPTR[k], ROWPTR[k+1]
+        cols = ICL[start+1:end]
+        vals = VAL[start+1:end].astype(np.float64)
+
+        # nonzeros of W below k that the row does not have yet
+        beyond = [i for i in queued if i > k]
+        extra = np.setdiff1d(np.array(beyond, dtype=cols.dtype), cols)
+        if len(extra):
+            cols = np.concatenate((cols, extra))
+            vals = np.concatenate((vals, np.zeros(len(extra))))
+            order = np.argsort(cols)
+            cols, vals = cols[order], vals[order]
+
+        d = float(VAL[start])
+        w = W[cols]
+        for j in np.flatnonzero(W[k]):
+            r = d * d + sign * W[k, j] ** 2
+            if r <= 0:
+                raise ValueError('nonpositive value on diagonal')
+            r **= 0.5
+            c, s = r / d, W[k, j] / d
+            vals = (vals + sign * s * w[:, j]) / c
+            w[:, j] = c * w[:, j] - s * vals
+            d = r
+        W[cols] = w
+        W[k] = 0
+        queued.discard(k)
+
+        new = cols[(w != 0).any(axis=1)]
+        for i in new.tolist():
+            if i not in queued:
+                queued.add(i)
+                heapq.heappush(pending, i)
+
+        if len(extra):
+            # fill that stayed zero (columns of W inactive at k) is not stored
+            keep = (vals != 0) | np.isin(cols, ICL[start+1:end])
+            filled[k] = (np.concatenate(([k], cols[keep])), np.concatenate(([d], vals[keep])))
+        else:
+            VAL[start] = d
+            VAL[start+1:end] = vals
+
+    if not filled:
+        return ICL, VAL, ROWPTR
+
+    # rows with fill get longer - copy the others to their new positions
+    lengths = np.diff(ROWPTR)
+    for k, (row_cols, _) in filled.items():
+        lengths[k] = len(row_cols)
+    NEW_ROWPTR = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(lengths, out=NEW_ROWPTR[1:])
+
+    rows = np.repeat(np.arange(n), np.diff(ROWPTR))
+    unchanged = ~np.isin(rows, list(filled))
+    positions = np.arange(len(ICL))[unchanged] - ROWPTR[rows[unchanged]] + NEW_ROWPTR[rows[unchanged]]
+    NEW_ICL = np.empty(NEW_ROWPTR[-1], dtype=np.int64)
+    NEW_VAL = np.empty(NEW_ROWPTR[-1], dtype=VAL.dtype)
+    NEW_ICL[positions] = ICL[unchanged]
+    NEW_VAL[positions] = VAL[unchanged]
+    for k, (row_cols, row_vals) in filled.items():
+        NEW_ICL[NEW_ROWPTR[k]:NEW_ROWPTR[k+1]] = row_cols
+        NEW_VAL[NEW_ROWPTR[k]:NEW_ROWPTR[k+1]] = row_vals
+
+    return NEW_ICL, NEW_VAL, NEW_ROWPTR
+
+
+def _modify(factor, W, sign):
+    if isinstance(factor, CholeskyFactor):
+        W = np.asarray(W, dtype=np.float64)
+        if factor.permutation is not None:
+            W = W[factor.permutation]
+        U = _modify(factor.U, W, sign)
+        # fill-in makes the symbolic analysis outdated
+        symbolic = factor.symbolic if U.nnz == factor.U.nnz else None
+        return CholeskyFactor(U, factor.permutation, symbolic)
+
+    n = len(factor[2]) - 1
+    ICL, VAL, ROWPTR = _rank_update(factor, W, sign)
+    return CSRMatrix(ICL, VAL, ROWPTR, (n, n), dtype=VAL.dtype)
+
+
+def update(factor, W):
+    '''factor of A + W @ W.T from the factor of A without refactoring,
+        factor is U = L.T in CSR format (sparse_cholesky and friends) or
+        CholeskyFactor (W is permuted like A), W one vector or k vectors as
+        columns (rank-k change in one pass over the affected rows)
+        only the rows on the elimination tree path of the nonzeros of W are
+        recomputed, new fill is inserted into them
+        returns a new factor of the same kind, the input is not modified'''
+    return _modify(factor, W, 1)
+
+
+def downdate(factor, W):
+    '''factor of A - W @ W.T, the same as update, raises ValueError when
+        A - W @ W.T is not positive definite'''
+    return _modify(factor, W, -1)
+
+
+def add_low_rank(A, W):
+    '''A + W @ W.T in CSR format (only rows and columns where W is nonzero change)'''
+    n = len(A[2]) - 1
+    W = np.asarray(W, dtype=np.float64).reshape(n, -1)
+    ICL, VAL, ROWPTR = A
+    support = np.flatnonzero(np.any(W != 0, axis=1))
+    outer = W[support] @ W[support].T
+
+    rows = np.concatenate((np.repeat(np.arange(n), np.diff(ROWPTR)), np.repeat(support, len(support))))
+    cols = np.concatenate((ICL, np.tile(support, len(support))))
+    vals = np.concatenate((VAL, outer.reshape(-1)))
+    return coo_to_csr(rows, cols, vals, n)
+
+
+def compare_with_refactor(A, W, ordering='auto'):
+    '''times of update(factor, W) against cholesky_factor of A + W @ W.T
+        with the same ordering
+        returns {'update', 'refactor' [s], 'nnz' (of U before and after),
+        'max_difference' (between the solutions of both factors)}'''
+    factor = cholesky_factor(A, ordering)
+
+    start = time()
+    updated = update(factor, W)
+    update_time = time() - start
+
+    start = time()
+    B = add_low_rank(A, W)
+    refactored = cholesky_factor(B, factor.permutation if factor.permutation is not None else 'natural')
+    refactor_time = time() - start
+
+    b = np.ones(len(A[2]) - 1)
+    return {
+        'update': update_time,
+        'refactor': refactor_time,
+        'nnz': (factor.U.nnz, updated.U.nnz),
+        'max_difference': float(np.abs(updated.solve(b) - refactored.solve(b)).max()),
+    }
@@ -0,0 +1,107 @@
+import numpy as np
+
+
+class CSRMatrix:
+    '''matrix in Compressed Sparse Row format backed by numpy arrays
+        ICL    - column index of every nonzero value (int32, int64 when
+                 the number of columns does not fit)
+        VAL    - nonzero values (float64, float32 for single precision factors)
+        ROWPTR - ICL/VAL index where every row starts, ROWPTR[-1] == nnz
+
+        unpacks like the (ICL, VAL, ROWPTR) tuple used by the rest of the lab:
+            ICL, VAL, ROWPTR = matrix'''
+
+    __slots__ = ('ICL', 'VAL', 'ROWPTR', 'shape')
+
+    def __init__(self, ICL, VAL, ROWPTR, shape=None, copy=False, dtype=np.float64):
+        if shape is None:
+            ICL = np.asarray(ICL)
+            n = len(ROWPTR) - 1
+            m = int(ICL.max()) + 1 if len(ICL) else 0
+            shape = (n, max(n, m))
+        self.shape = (int(shape[0]), int(shape[1]))
+
+        # ICL holds column indices, ROWPTR offsets up to nnz
+        int32_max = np.iinfo(np.int32).max
+        array = np.array if copy else np.asarray
+        self.ICL = array(ICL, dtype=np.int32 if self.shape[1] <= int32_max else np.int64)
+        self.VAL = array(VAL, dtype=dtype)
+        self.ROWPTR = array(ROWPTR, dtype=np.int32 if len(self.VAL) <= int32_max else np.int64)
+
+        if len(self.ROWPTR) != self.shape[0] + 1:
+            raise ValueError('ROWPTR length does not match the number of rows')
+        if len(self.ICL) != len(self.VAL) or self.ROWPTR[-1] != len(self.VAL):
+            raise ValueError('ICL, VAL and ROWPTR lengths do not match')
+
+    def __iter__(self):
+        return iter((self.ICL, self.VAL, self.ROWPTR))
+
+    def __getitem__(self, index):
+        return (self.ICL, self.VAL, self.ROWPTR)[index]
+
+    def __repr__(self):
+        return '<CSRMatrix {}x{}, nnz={}>'.format(self.shape[0], self.shape[1], self.nnz)
+
+    @property
+    def nnz(self):
+        return len(self.VAL)
+
+    @property
+    def nbytes(self):
+        return self.ICL.nbytes + self.VAL.nbytes + self.ROWPTR.nbytes
+
+    def row(self, i):
+        '''returns (columns, values) of the ith row, views - not copies'''
+        start, end = self.ROWPTR[i], self.ROWPTR[i+1]
+        return self.ICL[start:end], self.VAL[start:end]
+
+    def row_ids(self):
+        '''row index of every stored value (COO rows)'''
+        return np.repeat(np.arange(self.shape[0], dtype=self.ICL.dtype), np.diff(self.ROWPTR))
+
+    def diagonal(self):
+        diagonal = np.zeros(min(self.shape))
+        rows = self.row_ids()
+        on_diagonal = rows == self.ICL
+        diagonal[rows[on_diagonal]] = self.VAL[on_diagonal]
+        return diagonal
+
+    def copy(self):
+        return CSRMatrix(self.ICL, self.VAL, self.ROWPTR, self.shape, copy=True, dtype=self.VAL.dtype)
+
+    def transpose(self):
+        '''counting sort of the values by column, O(nnz)
+            rows of the result are sorted, as stable sort keeps row order'''
+        order = np.argsort(self.ICL, kind='stable')
+        ROWPTR = np.zeros(self.shape[1] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.ICL, minlength=self.shape[1]), out=ROWPTR[1:])
+        return CSRMatrix(self.row_ids()[order], self.VAL[order], ROWPTR,
+                         (self.shape[1], self.shape[0]), dtype=self.VAL.dtype)
+
+    @property
+    def T(self):
+        return self.transpose()
+
+    def to_csc(self):
+        '''returns (IRN, VAL, COLPTR) - Compressed Sparse Column arrays,
+            which are the CSR arrays of the transposed matrix'''
+        return tuple(self.transpose())
+
+    def to_dense(self):
+        matrix = np.zeros(self.shape)
+        matrix[self.row_ids(), self.ICL] = self.VAL
+        return matrix
+
+    def tolists(self):
+        '''(ICL, VAL, ROWPTR) as python lists, for the list based procedures'''
+        return self.ICL.tolist(), self.VAL.tolist(), self.ROWPTR.tolist()
+
+
+def as_lists(matrix):
+    '''working copy of (ICL, VAL, ROWPTR) as python lists,
+        accepts CSRMatrix as well as a tuple of lists or numpy arrays
+        the legacy sparse_cholesky and sparse_cholesky_permutation are not
+        ported to numpy - they still insert fill into python lists and
+        convert to this working copy first (the array based factorizations
+        are in cholesky_supernodal and cholesky_solve)'''
+    return tuple(x.tolist() if isinstance(x, np.ndarray) else list(x) for x in matrix)
@@ -0,0 +1,114 @@
+import numpy as np
+
+from csr_matrix import CSRMatrix
+from cholesky_solve import cholesky_solve
+
+
+def _incomplete_factor(ICL_A, VAL_A, ROWPTR_A, n, tol, fill, level_zero):
+    '''one attempt of the incomplete factorization, returns (ICL, VAL, ROWPTR)
+        of L.T or None on a nonpositive pivot'''
+    rows_icl = [None] * n
+    rows_val = [None] * n
+    # rows i < k with U[i, k] != 0 are linked by the column they reach next
+    next_position = [0] * n
+    waiting = [[] for _ in range(n)]
+
+    x = np.zeros(n)
+    mark = np.full(n, -1, dtype=np.int64)
+
+    for k in range(n):
+        start, end = ROWPTR_A[k], ROWPTR_A[k+1]
+        cols = ICL_A[start:end]
+        upper = cols >= k
+        a_cols = cols[upper]
+        x[a_cols] = VAL_A[start:end][upper]
+        mark[a_cols] = k
+        touched = [a_cols]
+
+        for i in waiting[k]:
+            p = next_position[i]
+            i_cols, i_vals = rows_icl[i], rows_val[i]
+            x[i_cols[p:]] -= i_vals[p] * i_vals[p:]
+
+            new_cols = i_cols[p+1:][mark[i_cols[p+1:]] != k]
+            if len(new_cols):
+                mark[new_cols] = k
+                touched.append(new_cols)
+
+            if p + 1 < len(i_cols):
+                next_position[i] = p + 1
+                waiting[i_cols[p+1]].append(i)
+        waiting[k] = None
+
+        dkk = x[k]
+        if dkk <= 0:
+            return None
+
+        cols = np.concatenate(touched)
+        cols = cols[cols > k]
+        vals = x[cols] / dkk ** 0.5
+        x[cols] = 0
+        x[k] = 0
+
+        # dropping - IC(0) keeps the pattern of A, ICT the values above
+        # tol * norm of the row of A, at most fill more than A has
+        if level_zero:
+            keep = np.isin(cols, a_cols)
+        else:
+            keep = np.abs(vals) > tol * np.linalg.norm(VAL_A[start:end])
+            if fill is not None and np.count_nonzero(keep) > len(a_cols) - 1 + fill:
+                limit = len(a_cols) - 1 + fill
+                largest = np.argsort(-np.abs(np.where(keep, vals, 0)), kind='stable')[:limit]
+                keep[:] = False
+                keep[largest] = True
+
+        cols, vals = cols[keep], vals[keep]
+        order = np.argsort(cols)
+        rows_icl[k] = np.concatenate(([k], cols[order]))
+        rows_val[k] = np.concatenate(([dkk ** 0.5], vals[order]))
+        if len(cols):
+            next_position[k] = 1
+            waiting[rows_icl[k][1]].append(k)
+
+    ROWPTR = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum([len(row) for row in rows_icl], out=ROWPTR[1:])
+    return np.concatenate(rows_icl), np.concatenate(rows_val), ROWPTR
+
+
+def incomplete_cholesky(matrix, tol=1e-3, fill=None, level_zero=False, shift=0.0, max_shifts=10):
+    '''incomplete Cholesky factor U = L.T (CSRMatrix), U.T @ U ~ matrix
+        level_zero=True - IC(0), nonzeros only where A has them
+        otherwise ICT - fill is computed, values of a row of U below
+        tol * (2-norm of the row of A) are dropped, and with fill given every
+        row keeps at most fill entries more than the row of A (the largest ones)
+        rows are computed up-looking (row k from the rows above it that reach
+        column k, linked by the next column they reach) with a dense work row,
+        not with the list insertion of sparse_cholesky
+        a nonpositive pivot restarts the factorization of A + alpha * diag(A)
+        with alpha doubled (starting at 1e-3), at most max_shifts times
+        the matrix has to be stored with both triangles, only the upper is read
+        returns (U, alpha used)'''
+    ICL, VAL, ROWPTR = matrix
+    ICL = np.asarray(ICL, dtype=np.int64)
+    VAL = np.asarray(VAL, dtype=np.float64)
+    ROWPTR = np.asarray(ROWPTR, dtype=np.int64)
+    n = len(ROWPTR) - 1
+
+    rows = np.repeat(np.arange(n), np.diff(ROWPTR))
+    diagonal = np.zeros(n)
+    diagonal[rows[ICL == rows]] = VAL[ICL == rows]
+
+    alpha = shift
+    for _ in range(max_shifts + 1):
+        shifted = VAL + np.where(ICL == rows, alpha * diagonal[rows], 0)
+        factor = _incomplete_factor(ICL, shifted, ROWPTR, n, tol, fill, level_zero)
+        if factor is not None:
+            return CSRMatrix(*factor, (n, n)), alpha
+        alpha = max(2 * alpha, 1e-3)
+
+    raise ValueError('nonpositive value on diagonal')
+
+
+def ic_preconditioner(U):
+    '''z = inv(U.T @ U) @ r as a function of r, for pcg'''
+    return lambda r: cholesky_solve(U, r)
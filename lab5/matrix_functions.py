@@ -1,54 +1,34 @@
-import numpy as np
-
-
-def read_matrix(file_name):
-    with open(file_name, 'r') as file:
-        for line in file:
-            if line.strip() == '':
-                continue
-            if line[0] == '#':
-                if line[2:6] == "rows":
-                    _, _, size = line.split()
-                    size = int(size)
-                    matrix = np.zeros((size, size))
-            else:
-                row, col, val = line.split(' ')
-                matrix[int(row)-1, int(col)-1] = val
+from concurrent.futures import ThreadPoolExecutor
 
-    return matrix
+import numpy as np
+from csr_matrix import CSRMatrix, as_lists
+from matrix_io import read_matrix, read_matrix_csr, coo_to_csr, load_matrix_csr
 
 
-def convert_to_csr(matrix):
-    m, n = matrix.shape
-    ICL = []
-    VAL = []
-    ROWPTR = []
-    counter = 0
+def convert_to_csr(matrix, tol=1e-8):
+    '''values with abs(val) < tol are skipped
+        mask, nonzero and cumsum over row counts instead of visiting every cell'''
+    matrix = np.asarray(matrix, dtype=np.float64)
+    n, m = matrix.shape
 
-    for i in range(n): # rows
-        ROWPTR.append(counter)
-        for j in range(m): # columns
-            val_ij = matrix[i, j]
-            if abs(val_ij) < 1e-8:
-                continue
-            ICL.append(j)
-            VAL.append(val_ij)
-            counter += 1
+    # np.nonzero goes row by row, so columns in every row come out sorted
+    rows, cols = np.nonzero(np.abs(matrix) >= tol)
+    ROWPTR = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=ROWPTR[1:])
 
-    ROWPTR.append(counter)
+    return CSRMatrix(cols, matrix[rows, cols], ROWPTR, (n, m))
 
-    return ICL, VAL, ROWPTR
-    
 
-def sparse_cholesky(matrix):
+def sparse_cholesky(matrix, profiler=None):
     '''
         returns L.T matrix in CSR format
         that (L.T.)T @ L.T == matrix
+        for CSRMatrix input the result is CSRMatrix as well
+        profiler (profiling.CholeskyProfiler) records per pivot statistics,
+        its hooks run once per pivot and only when it is given
     '''
 
-    ICL = matrix[0][:]
-    VAL = matrix[1][:]
-    ROWPTR = matrix[2][:]
+    ICL, VAL, ROWPTR = as_lists(matrix)
     
     n = len(ROWPTR) - 1
     
@@ -73,188 +53,325 @@ def sparse_cholesky(matrix):
                 return start + 1
             return None
 
-    for k in range(n):
-        row_start = ROWPTR[k]
-        row_end = ROWPTR[k+1]
-
-        if ICL[row_start] != k or VAL[row_start] < 0:
-            raise Exception('nonpositive value on diagonal')
-
-        VAL[row_start] **= 0.5
-        dkk = VAL[row_start]
-
-        # last row -> nothing to eliminate
-        if k == n-1:
-            break
-
-        for j in range(row_start+ 1, row_end):
-            VAL[j] /= dkk
-
-        # new arrays for ICL, VAL, ROWPTR
-        # starting with part of the matrix that won't be eliminated
-        # later we're adding all other values after each elimination step
-        new_icl = ICL[:row_end]
-        new_val = VAL[:row_end]
-        new_rowptr = ROWPTR[:k+2]
-
-        vk_index = row_start + 1
-
-        for j in range(k+1, n):
-            # top_row = kth_row (not always 0th row!)
-            # j_row = jth_row
-            # we aim to calculate:  j_row = j_row - top_row*vk
-            j_row_start = ROWPTR[j]
-            j_row_end = ROWPTR[j+1]
-
-            # we find indices in top_row ICL and j_row ICL on which value j is,
-            # so we can start eliminating from there
-            j_index_j_row = get_col_in_row(ICL[j_row_start:j_row_end], j)
-            j_index_top_row = get_col_in_row(ICL[row_start:row_end], j)
-
-            # if vk is 0, we just copy j_row from jth index and continue to the next row
-            if vk_index >= row_end or ICL[vk_index] != j:
-                if j_index_j_row is not None:
-                    new_icl += ICL[j_row_start+j_index_j_row:j_row_end]
-                    new_val += VAL[j_row_start+j_index_j_row:j_row_end]
-
-                new_rowptr.append(len(new_icl))
-                continue
-
-            vk = VAL[vk_index]
-
-            # if both top row and jth row are empty after jth index, we move onto the next row
-            if j_index_j_row is None and j_index_top_row is None:
-                new_rowptr.append(len(new_icl))
-                continue
-
-            # if jth row is empty after jth index we copy -vk*top_row
-            if j_index_j_row is None:
-                new_icl += ICL[row_start + j_index_top_row:row_end]
-                new_val += [-vk*x for x in VAL[row_start +
-                                               j_index_top_row:row_end]]
-                new_rowptr.append(len(new_icl))
-                continue
-            else:
-                 j_row_index = j_row_start + j_index_j_row
-
-            # if top row is empty after jth index we just copy jth row as it is
-            if j_index_top_row is None:
-                new_icl += ICL[j_row_index:j_row_end]
-                new_val += VAL[j_row_index:j_row_end]
-                new_rowptr.append(len(new_icl))
-                continue
-            else:
-                top_row_index = row_start + j_index_top_row
-
-
-            # we iterate through top_row and j_row at the same time
-            # doing the elimination
-            # new non-zero values may occur
-            while j_row_index < j_row_end and top_row_index < row_end:
-                top_col = ICL[top_row_index]
-                j_col = ICL[j_row_index]
+    if profiler is not None:
+        get_col_in_row = profiler.timed_search(get_col_in_row)
+        profiler.start(ICL)
+
+    # finish() runs on the exception of a nonpositive pivot too, so tracing
+    # started by the profiler does not stay on
+    try:
+        for k in range(n):
+            row_start = ROWPTR[k]
+            row_end = ROWPTR[k+1]
+
+            if ICL[row_start] != k or VAL[row_start] < 0:
+                raise Exception('nonpositive value on diagonal')
+
+            VAL[row_start] **= 0.5
+            dkk = VAL[row_start]
+
+            if profiler is not None:
+                profiler.start_pivot(k)
+
+            # last row -> nothing to eliminate
+            if k == n-1:
+                if profiler is not None:
+                    profiler.copied()
+                    profiler.end_pivot(k, ICL, ROWPTR, ICL, ROWPTR)
+                break
+
+            for j in range(row_start+ 1, row_end):
+                VAL[j] /= dkk
+
+            # new arrays for ICL, VAL, ROWPTR
+            # starting with part of the matrix that won't be eliminated
+            # later we're adding all other values after each elimination step
+            new_icl = ICL[:row_end]
+            new_val = VAL[:row_end]
+            new_rowptr = ROWPTR[:k+2]
+
+            if profiler is not None:
+                profiler.copied()
+
+            vk_index = row_start + 1
+
+            for j in range(k+1, n):
+                # top_row = kth_row (not always 0th row!)
+                # j_row = jth_row
+                # we aim to calculate:  j_row = j_row - top_row*vk
+                j_row_start = ROWPTR[j]
+                j_row_end = ROWPTR[j+1]
+
+                # we find indices in top_row ICL and j_row ICL on which value j is,
+                # so we can start eliminating from there
+                j_index_j_row = get_col_in_row(ICL[j_row_start:j_row_end], j)
+                j_index_top_row = get_col_in_row(ICL[row_start:row_end], j)
+
+                # if vk is 0, we just copy j_row from jth index and continue to the next row
+                if vk_index >= row_end or ICL[vk_index] != j:
+                    if j_index_j_row is not None:
+                        new_icl += ICL[j_row_start+j_index_j_row:j_row_end]
+                        new_val += VAL[j_row_start+j_index_j_row:j_row_end]
+
+                    new_rowptr.append(len(new_icl))
+                    continue
+
+                vk = VAL[vk_index]
+
+                # if both top row and jth row are empty after jth index, we move onto the next row
+                if j_index_j_row is None and j_index_top_row is None:
+                    new_rowptr.append(len(new_icl))
+                    continue
+
+                # if jth row is empty after jth index we copy -vk*top_row
+                if j_index_j_row is None:
+                    new_icl += ICL[row_start + j_index_top_row:row_end]
+                    new_val += [-vk*x for x in VAL[row_start +
+                                                   j_index_top_row:row_end]]
+                    new_rowptr.append(len(new_icl))
+                    continue
+                else:
+                     j_row_index = j_row_start + j_index_j_row
+
+                # if top row is empty after jth index we just copy jth row as it is
+                if j_index_top_row is None:
+                    new_icl += ICL[j_row_index:j_row_end]
+                    new_val += VAL[j_row_index:j_row_end]
+                    new_rowptr.append(len(new_icl))
+                    continue
+                else:
+                    top_row_index = row_start + j_index_top_row
+
+
+                # we iterate through top_row and j_row at the same time
+                # doing the elimination
+                # new non-zero values may occur
+                while j_row_index < j_row_end and top_row_index < row_end:
+                    top_col = ICL[top_row_index]
+                    j_col = ICL[j_row_index]
+
+                    # nonzero value in kth row, zero in jth
+                    # new nonzero value
+                    if top_col < j_col:
+                        val = -vk*VAL[top_row_index]
+                        if abs(val) > 1e-8:
+                            new_icl.append(top_col)
+                            new_val.append(val)
+                        top_row_index += 1
+
+                    # both values nonzero
+                    elif top_col == j_col:
+                        val = VAL[j_row_index]-vk*VAL[top_row_index]
+                        if abs(val) > 1e-8:
+                            new_icl.append(top_col)
+                            new_val.append(val)
+
+                        top_row_index += 1
+                        j_row_index += 1
+
+                    # nonzero in jth row, but zero in k
+                    elif top_col > j_col:
+                        new_icl.append(j_col)
+                        new_val.append(VAL[j_row_index])
+                        j_row_index += 1
+
+                # there might still be nonzero values in jth row
+                # and just zeros in kth
+                while j_row_index < j_row_end:
+                    new_icl.append(ICL[j_row_index])
+                    new_val.append(VAL[j_row_index])
+                    j_row_index += 1
 
-                # nonzero value in kth row, zero in jth
-                # new nonzero value
-                if top_col < j_col:
+                # there might still be nonzero values in kth row
+                # and just zeros in jth
+                while top_row_index < row_end:
                     val = -vk*VAL[top_row_index]
                     if abs(val) > 1e-8:
-                        new_icl.append(top_col)
-                        new_val.append(val)
-                    top_row_index += 1
-
-                # both values nonzero
-                elif top_col == j_col:
-                    val = VAL[j_row_index]-vk*VAL[top_row_index]
-                    if abs(val) > 1e-8:
-                        new_icl.append(top_col)
+                        new_icl.append(ICL[top_row_index])
                         new_val.append(val)
-
                     top_row_index += 1
-                    j_row_index += 1
 
-                # nonzero in jth row, but zero in k
-                elif top_col > j_col:
-                    new_icl.append(j_col)
-                    new_val.append(VAL[j_row_index])
-                    j_row_index += 1
-
-            # there might still be nonzero values in jth row
-            # and just zeros in kth
-            while j_row_index < j_row_end:
-                new_icl.append(ICL[j_row_index])
-                new_val.append(VAL[j_row_index])
-                j_row_index += 1
-
-            # there might still be nonzero values in kth row
-            # and just zeros in jth
-            while top_row_index < row_end:
-                val = -vk*VAL[top_row_index]
-                if abs(val) > 1e-8:
-                    new_icl.append(ICL[top_row_index])
-                    new_val.append(val)
-                top_row_index += 1
+                new_rowptr.append(len(new_icl))
 
-            new_rowptr.append(len(new_icl))
+                if vk_index < row_end and ICL[vk_index] == j:
+                    vk_index += 1
 
-            if vk_index < row_end and ICL[vk_index] == j:
-                vk_index += 1
+            if profiler is not None:
+                profiler.end_pivot(k, ICL, ROWPTR, new_icl, new_rowptr)
 
-        ICL = new_icl
-        ROWPTR = new_rowptr
-        VAL = new_val
+            ICL = new_icl
+            ROWPTR = new_rowptr
+            VAL = new_val
+    finally:
+        if profiler is not None:
+            profiler.finish()
 
+    if isinstance(matrix, CSRMatrix):
+        return CSRMatrix(ICL, VAL, ROWPTR, matrix.shape)
     return ICL, VAL, ROWPTR
     
     
 def get_matrix_from_csr(A):
+    if isinstance(A, CSRMatrix):
+        return A.to_dense()
+
     ICL, VAL, ROWPTR = A
-    VAL = VAL.copy()
     
     n = len(ROWPTR) - 1
     matrix = np.zeros((n, n))
 
-    for row in range(n):
-        for j in range(ROWPTR[row], ROWPTR[row+1]):
-            matrix[row, ICL[j]] = VAL[j]
+    # row index of every value, then one fancy-index scatter
+    rows = np.repeat(np.arange(n), np.diff(ROWPTR))
+    matrix[rows, np.asarray(ICL, dtype=np.int64)] = VAL
             
     return matrix
     
     
-def get_ICL_VAL_from_dict(C_ROW):
-    C_ROW_sorted = sorted(C_ROW.items(), key=lambda item : item[0]) # sorting by key (column index)
-    ICL_C = [x[0] for x in C_ROW_sorted] # column indexes list
-    VAL_C = [x[1] for x in C_ROW_sorted] # values list
-    return ICL_C, VAL_C
- 
-    
-def matmul_CSR(A, B):
+def _csr_arrays(matrix):
+    ICL, VAL, ROWPTR = matrix
+    return (np.asarray(ICL, dtype=np.int64), np.asarray(VAL, dtype=np.float64),
+            np.asarray(ROWPTR, dtype=np.int64))
+
+
+def _csr_columns(matrix):
+    if isinstance(matrix, CSRMatrix):
+        return matrix.shape[1]
+    ICL, _, ROWPTR = matrix
+    return max(len(ROWPTR) - 1, int(np.max(ICL)) + 1 if len(ICL) else 0)
+
+
+def _expand_rows(rows, A, B):
+    '''products of rows of A @ B before summing duplicates: every A[i, k]
+        times the whole row k of B, for the consecutive range of rows
+        returns (row index relative to rows.start, column, product)'''
     ICL_A, VAL_A, ROWPTR_A = A
-    ICL_B, VAL_B, ROWPTR_B = B    
-    ICL_C, VAL_C, ROWPTR_C = [], [], []
-
-    elements_counter = 0
-    for i in range(len(ROWPTR_A) - 1): # rows in A
-        row_a_start_idx = ROWPTR_A[i]
-        row_a_end_idx = ROWPTR_A[i+1]
-        C_ROW = dict() # dict to store results of row_A * rows_B
-        for j in range(row_a_start_idx,row_a_end_idx): # indexes of values in row A
-            col_a = ICL_A[j]
-            val_a = VAL_A[j]
-            row_b_start_idx = ROWPTR_B[col_a] # column idx in A maps to row idx in B
-            row_b_end_idx = ROWPTR_B[col_a + 1] # col_a + 1 to get range of value indexes in B row
-            for p in range(row_b_start_idx,row_b_end_idx): # indexes of values in row B
-                col_b = ICL_B[p]
-                val_b = VAL_B[p]
-                C_ROW[col_b] = C_ROW.get(col_b, 0) + (val_a * val_b) # update dict with val_a * val_b
-                
-        ICL, VAL = get_ICL_VAL_from_dict(C_ROW)
-        ICL_C += ICL
-        VAL_C += VAL
-        ROWPTR_C.append(elements_counter)
-        elements_counter += len(VAL)
-    
-    ROWPTR_C.append(elements_counter)
-    return ICL_C, VAL_C, ROWPTR_C
-    
-    
+    ICL_B, VAL_B, ROWPTR_B = B
+
+    a_start, a_end = ROWPTR_A[rows.start], ROWPTR_A[rows.stop]
+    ks = ICL_A[a_start:a_end]
+    a_rows = np.repeat(np.arange(len(rows)), np.diff(ROWPTR_A[rows.start:rows.stop+1]))
+
+    starts = ROWPTR_B[ks]
+    counts = ROWPTR_B[ks + 1] - starts
+    offsets = np.cumsum(counts) - counts
+    index = np.repeat(starts - offsets, counts) + np.arange(counts.sum())
+
+    products = np.repeat(VAL_A[a_start:a_end], counts) * VAL_B[index]
+    return np.repeat(a_rows, counts), ICL_B[index], products
+
+
+def _row_blocks(rows, m, accumulator_size):
+    '''splits the range of rows into blocks whose dense accumulators
+        (one row of length m for every row) fit into accumulator_size'''
+    block = max(1, accumulator_size // max(m, 1))
+    return [range(start, min(start + block, rows.stop)) for start in range(rows.start, rows.stop, block)]
+
+
+def _row_ranges(n, workers):
+    bounds = np.linspace(0, n, workers + 1).astype(int)
+    return [range(bounds[w], bounds[w+1]) for w in range(workers)]
+
+
+def _run_ranges(function, n, workers):
+    if workers == 1:
+        return [function(range(n))]
+    with ThreadPoolExecutor(workers) as pool:
+        return list(pool.map(function, _row_ranges(n, workers)))
+
+
+def matmul_CSR_symbolic(A, B, workers=1, accumulator_size=1 << 20):
+    '''structure of A @ B: exact nnz of every row and sorted column indices
+        returns (ICL, ROWPTR) of the product, can be reused by matmul_CSR_numeric
+        for every product of matrices with the same patterns'''
+    m = _csr_columns(B)
+    A, B = _csr_arrays(A), _csr_arrays(B)
+    n = len(A[2]) - 1
+
+    def structure(rows):
+        parts = []
+        for block in _row_blocks(rows, m, accumulator_size):
+            local_rows, cols, _ = _expand_rows(block, A, B)
+            keys = np.unique(local_rows * m + cols)
+            parts.append((np.bincount(keys // m, minlength=len(block)), keys % m))
+        return parts
+
+    parts = [part for worker_parts in _run_ranges(structure, n, workers) for part in worker_parts]
+    ROWPTR = np.zeros(n + 1, dtype=np.int64)
+    if parts:
+        np.cumsum(np.concatenate([counts for counts, _ in parts]), out=ROWPTR[1:])
+        ICL = np.concatenate([cols for _, cols in parts])
+    else:
+        ICL = np.zeros(0, dtype=np.int64)
+
+    return ICL, ROWPTR
+
+
+def matmul_CSR_numeric(A, B, ICL_C, ROWPTR_C, workers=1, accumulator_size=1 << 20):
+    '''values of A @ B for the structure from matmul_CSR_symbolic
+        Gustavson's algorithm: products are summed in a dense accumulator row
+        and gathered at the known columns into preallocated VAL
+        a block of rows is done at once with one accumulator row for each,
+        with workers > 1 ranges of rows are computed by a thread pool,
+        each with its own accumulator, writing to disjoint parts of VAL'''
+    m = _csr_columns(B)
+    A, B = _csr_arrays(A), _csr_arrays(B)
+    n = len(ROWPTR_C) - 1
+    ROWPTR_C = np.asarray(ROWPTR_C, dtype=np.int64)
+    VAL_C = np.zeros(len(ICL_C))
+
+    def values(rows):
+        accumulator = np.zeros(min(len(rows), max(1, accumulator_size // max(m, 1))) * m)
+        for block in _row_blocks(rows, m, accumulator_size):
+            local_rows, cols, products = _expand_rows(block, A, B)
+            np.add.at(accumulator, local_rows * m + cols, products)
+
+            start, end = ROWPTR_C[block.start], ROWPTR_C[block.stop]
+            c_rows = np.repeat(np.arange(len(block)), np.diff(ROWPTR_C[block.start:block.stop+1]))
+            keys = c_rows * m + ICL_C[start:end]
+            VAL_C[start:end] = accumulator[keys]
+            accumulator[keys] = 0
+
+    _run_ranges(values, n, workers)
+    return VAL_C
+
+
+def matmul_CSR(A, B, workers=1, accumulator_size=1 << 20):
+    '''A @ B for matrices in CSR format, returns CSRMatrix
+        symbolic pass finds the exact structure of every row, so the result
+        arrays are allocated once, numeric pass fills them with Gustavson's
+        dense accumulator (matmul_CSR_symbolic, matmul_CSR_numeric)
+        accumulator_size bounds the memory of the accumulators [values]'''
+    ICL_C, ROWPTR_C = matmul_CSR_symbolic(A, B, workers, accumulator_size)
+    VAL_C = matmul_CSR_numeric(A, B, ICL_C, ROWPTR_C, workers, accumulator_size)
+    return CSRMatrix(ICL_C, VAL_C, ROWPTR_C, (len(ROWPTR_C) - 1, _csr_columns(B)))
+
+
+def matmul_CSR_dense(A, X):
+    '''A @ X for A in CSR format and dense X - one vector (SpMV)
+        or a block of vectors as columns of X (SpMM)
+        products VAL * X[ICL] are summed per row with one np.add.reduceat,
+        X rows are gathered once for all right-hand sides'''
+    ICL, VAL, ROWPTR = _csr_arrays(A)
+    X = np.asarray(X, dtype=np.float64)
+    n = len(ROWPTR) - 1
+
+    products = X[ICL] * (VAL if X.ndim == 1 else VAL[:, None])
+    Y = np.zeros((n,) + X.shape[1:])
+
+    # reduceat can not produce empty segments, so empty rows are left out
+    starts = ROWPTR[:-1]
+    nonempty = starts < ROWPTR[1:]
+    if len(products):
+        Y[nonempty] = np.add.reduceat(products, starts[nonempty], axis=0)
+    return Y
+
+
+def spmv(A, x):
+    '''A @ x for A in CSR format and vector x'''
+    return matmul_CSR_dense(A, np.asarray(x, dtype=np.float64).reshape(-1))
+
+
+def spmm(A, X):
+    '''A @ X for A in CSR format and dense matrix X (many vectors at once)'''
+    X = np.asarray(X, dtype=np.float64)
+    return matmul_CSR_dense(A, X.reshape(len(X), -1))
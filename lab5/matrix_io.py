@@ -0,0 +1,323 @@
+import hashlib
+import os
+import struct
+
+import numpy as np
+
+from csr_matrix import CSRMatrix
+
+
+def read_header(file):
+    '''reads the "# key: value" comment lines written by Octave
+        returns a dict of the header fields and leaves the file positioned
+        at the first line of the triplet body'''
+    header = {}
+    while True:
+        position = file.tell()
+        line = file.readline()
+        if line == '':
+            break
+        if line.strip() == '':
+            continue
+        if line[0] != '#':
+            file.seek(position)
+            break
+        key, _, value = line[1:].partition(':')
+        header[key.strip()] = value.strip()
+
+    for key in ('rows', 'columns', 'nnz'):
+        if key in header:
+            header[key] = int(header[key])
+
+    return header
+
+
+def iter_triplets(file_name, chunk_size=1 << 20):
+    '''yields (rows, cols, vals) chunks of the triplet body as numpy arrays,
+        indices already shifted to start from 0
+        chunk_size is the approximate number of bytes parsed at once,
+        so memory stays bounded no matter how big the file is'''
+    with open(file_name, 'r') as file:
+        read_header(file)
+        while True:
+            lines = file.readlines(chunk_size)
+            if not lines:
+                break
+            text = ''.join(lines)
+            if not text.strip():
+                # trailing empty lines
+                continue
+            chunk = np.fromstring(text, sep=' ').reshape(-1, 3)
+            yield (chunk[:, 0].astype(np.int64) - 1,
+                   chunk[:, 1].astype(np.int64) - 1,
+                   chunk[:, 2])
+
+
+def read_matrix_coo(file_name, tol=1e-8, chunk_size=1 << 20):
+    '''returns (rows, cols, vals, shape) of the whole file in COO format
+        values with abs(val) < tol are dropped, like in convert_to_csr'''
+    with open(file_name, 'r') as file:
+        header = read_header(file)
+
+    rows, cols, vals = [], [], []
+    for r, c, v in iter_triplets(file_name, chunk_size):
+        keep = np.abs(v) >= tol
+        rows.append(r[keep])
+        cols.append(c[keep])
+        vals.append(v[keep])
+
+    shape = (header['rows'], header['columns'])
+    if not vals:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty.copy(), np.zeros(0), shape
+
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(vals), shape
+
+
+def coo_to_csr(rows, cols, vals, n, n_cols=None, tol=0, sum_duplicates=True):
+    '''builds CSRMatrix with n rows out of COO triplets
+        without creating a dense intermediate
+        repeated (row, col) pairs - e.g. from finite element assembly - are summed,
+        values with abs(val) < tol are dropped afterwards'''
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    vals = np.asarray(vals, dtype=np.float64)
+
+    # stable sort by row, then by column inside each row
+    order = np.lexsort((cols, rows))
+    rows, cols, vals = rows[order], cols[order], vals[order]
+
+    if sum_duplicates and len(vals):
+        first = np.ones(len(vals), dtype=bool)
+        first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+        starts = np.flatnonzero(first)
+        rows, cols, vals = rows[starts], cols[starts], np.add.reduceat(vals, starts)
+
+    if tol > 0:
+        keep = np.abs(vals) >= tol
+        rows, cols, vals = rows[keep], cols[keep], vals[keep]
+
+    ROWPTR = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=ROWPTR[1:])
+
+    return CSRMatrix(cols, vals, ROWPTR, (n, n if n_cols is None else n_cols))
+
+
+def _read_matrix_csr_streaming(file_name, shape, tol, chunk_size):
+    n = shape[0]
+
+    # first pass: only count nonzeros in every row
+    counts = np.zeros(n, dtype=np.int64)
+    for r, _, v in iter_triplets(file_name, chunk_size):
+        counts += np.bincount(r[np.abs(v) >= tol], minlength=n)
+
+    nnz = int(counts.sum())
+    index_dtype = np.int32 if nnz < np.iinfo(np.int32).max else np.int64
+
+    ROWPTR = np.zeros(n + 1, dtype=index_dtype)
+    np.cumsum(counts, out=ROWPTR[1:])
+    ICL = np.empty(nnz, dtype=index_dtype)
+    VAL = np.empty(nnz, dtype=np.float64)
+
+    # second pass: scatter every chunk to the next free slots of its rows
+    # next_free[row] is the index in ICL/VAL where the next value of row goes
+    next_free = ROWPTR[:-1].astype(np.int64)
+    for r, c, v in iter_triplets(file_name, chunk_size):
+        keep = np.abs(v) >= tol
+        r, c, v = r[keep], c[keep], v[keep]
+
+        order = np.argsort(r, kind='stable')
+        r, c, v = r[order], c[order], v[order]
+
+        # position of each element among the elements of the same row in this chunk
+        chunk_counts = np.bincount(r, minlength=n)
+        chunk_starts = np.cumsum(chunk_counts) - chunk_counts
+        offsets = np.arange(len(r)) - chunk_starts[r]
+
+        target = next_free[r] + offsets
+        ICL[target] = c
+        VAL[target] = v
+        next_free += chunk_counts
+
+    # Octave writes the matrix column by column, so rows are already sorted,
+    # other writers might not be
+    row_ids = np.repeat(np.arange(n), np.diff(ROWPTR))
+    if nnz and np.any((np.diff(ICL) <= 0) & (np.diff(row_ids) == 0)):
+        order = np.lexsort((ICL, row_ids))
+        ICL[:] = ICL[order]
+        VAL[:] = VAL[order]
+
+    # repeated (row, col) pairs are summed, like coo_to_csr does
+    if nnz:
+        first = np.ones(nnz, dtype=bool)
+        first[1:] = (ICL[1:] != ICL[:-1]) | (row_ids[1:] != row_ids[:-1])
+        if not first.all():
+            starts = np.flatnonzero(first)
+            ICL, VAL = ICL[starts], np.add.reduceat(VAL, starts)
+            np.cumsum(np.bincount(row_ids[starts], minlength=n), out=ROWPTR[1:])
+
+    return CSRMatrix(ICL, VAL, ROWPTR, shape)
+
+
+def read_matrix_csr(file_name, tol=1e-8, streaming=False, chunk_size=1 << 20):
+    '''reads Octave sparse matrix text file straight into CSRMatrix,
+        never creating a dense matrix
+        with streaming=True the file is read twice chunk by chunk (counting,
+        then filling preallocated arrays), so only the CSR arrays and one chunk
+        have to fit in memory'''
+    with open(file_name, 'r') as file:
+        header = read_header(file)
+    shape = (header['rows'], header['columns'])
+
+    if streaming:
+        return _read_matrix_csr_streaming(file_name, shape, tol, chunk_size)
+
+    rows, cols, vals, _ = read_matrix_coo(file_name, tol, chunk_size)
+    return coo_to_csr(rows, cols, vals, *shape)
+
+
+def read_matrix(file_name):
+    '''reads Octave sparse matrix text file into a dense numpy array'''
+    rows, cols, vals, shape = read_matrix_coo(file_name, tol=0)
+    matrix = np.zeros(shape)
+    matrix[rows, cols] = vals
+    return matrix
+
+
+# binary CSR format:
+#   header (64 bytes): magic, version, index itemsize, rows, columns, nnz,
+#                      source mtime [ns], first 16 bytes of source sha256,
+#                      tol the values were dropped with
+#   ROWPTR (rows+1 indices), ICL (nnz indices), padding to 8 bytes, VAL (nnz float64)
+BINARY_MAGIC = b'CSRB'
+BINARY_VERSION = 2
+_HEADER = struct.Struct('<4sHHqqqq16sd')
+_MTIME_OFFSET = 32
+_HEADER_SIZE = 64
+
+
+def _file_hash(file_name):
+    digest = hashlib.sha256()
+    with open(file_name, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.digest()[:16]
+
+
+def _binary_layout(n, nnz, index_itemsize):
+    rowptr_offset = _HEADER_SIZE
+    icl_offset = rowptr_offset + (n + 1) * index_itemsize
+    val_offset = icl_offset + nnz * index_itemsize
+    val_offset += -val_offset % 8
+    return rowptr_offset, icl_offset, val_offset
+
+
+def write_csr_binary(file_name, matrix, source_mtime=0, source_hash=bytes(16), tol=0.0):
+    '''writes CSRMatrix to the binary CSR format
+        the file is written under a temporary name and then renamed,
+        so readers never see a half written file'''
+    ICL, VAL, ROWPTR = matrix
+    shape = matrix.shape
+    nnz = len(VAL)
+    index_dtype = np.int32 if nnz < np.iinfo(np.int32).max else np.int64
+    index_itemsize = np.dtype(index_dtype).itemsize
+    _, icl_offset, val_offset = _binary_layout(shape[0], nnz, index_itemsize)
+
+    tmp_name = '{}.{}.tmp'.format(file_name, os.getpid())
+    with open(tmp_name, 'wb') as file:
+        header = _HEADER.pack(BINARY_MAGIC, BINARY_VERSION, index_itemsize,
+                              shape[0], shape[1], nnz, source_mtime, source_hash, tol)
+        file.write(header.ljust(_HEADER_SIZE, b'\0'))
+        file.write(np.ascontiguousarray(ROWPTR, dtype=index_dtype).tobytes())
+        file.write(np.ascontiguousarray(ICL, dtype=index_dtype).tobytes())
+        file.write(bytes(val_offset - icl_offset - nnz * index_itemsize))
+        file.write(np.ascontiguousarray(VAL, dtype=np.float64).tobytes())
+    os.replace(tmp_name, file_name)
+
+
+def read_binary_header(file_name):
+    '''returns the header of the binary CSR file as a dict'''
+    with open(file_name, 'rb') as file:
+        raw = file.read(_HEADER_SIZE)
+    if len(raw) < _HEADER_SIZE:
+        raise ValueError('{} is not a binary CSR file'.format(file_name))
+
+    magic, version, index_itemsize, rows, columns, nnz, mtime, source_hash, tol = \
+        _HEADER.unpack(raw[:_HEADER.size])
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError('{} is not a binary CSR file'.format(file_name))
+
+    return {
+        'index_itemsize': index_itemsize,
+        'rows': rows,
+        'columns': columns,
+        'nnz': nnz,
+        'mtime': mtime,
+        'hash': source_hash,
+        'tol': tol,
+    }
+
+
+def read_csr_binary(file_name):
+    '''memory maps the binary CSR file, nothing is copied
+        returns CSRMatrix backed by read-only np.memmap arrays,
+        so every process loading the same file shares its pages'''
+    header = read_binary_header(file_name)
+    n, nnz = header['rows'], header['nnz']
+    index_dtype = np.int32 if header['index_itemsize'] == 4 else np.int64
+    rowptr_offset, icl_offset, val_offset = _binary_layout(n, nnz, header['index_itemsize'])
+
+    ROWPTR = np.memmap(file_name, dtype=index_dtype, mode='r', offset=rowptr_offset, shape=(n + 1,))
+    if nnz == 0:
+        ICL = np.zeros(0, dtype=index_dtype)
+        VAL = np.zeros(0)
+    else:
+        ICL = np.memmap(file_name, dtype=index_dtype, mode='r', offset=icl_offset, shape=(nnz,))
+        VAL = np.memmap(file_name, dtype=np.float64, mode='r', offset=val_offset, shape=(nnz,))
+
+    return CSRMatrix(ICL, VAL, ROWPTR, (n, header['columns']))
+
+
+def cache_path(file_name, cache_dir=None):
+    '''path of the binary cache for a text matrix file,
+        by default in .cache directory next to the source file'''
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(file_name)), '.cache')
+    return os.path.join(cache_dir, os.path.basename(file_name) + '.csr')
+
+
+def load_matrix_csr(file_name, cache_dir=None, tol=1e-8):
+    '''reads Octave text file in CSR format through the binary cache
+        first call parses the text and writes the cache, later calls
+        only memory map it
+        cache is valid if it was written with the same tol and the source
+        mtime matches, or the mtime changed but the content hash is still
+        the same (e.g. after git checkout), otherwise it is rebuilt'''
+    binary_name = cache_path(file_name, cache_dir)
+    mtime = os.stat(file_name).st_mtime_ns
+
+    if os.path.exists(binary_name):
+        try:
+            header = read_binary_header(binary_name)
+        except ValueError:
+            header = None
+
+        if header is not None and header['tol'] == tol:
+            if header['mtime'] == mtime:
+                return read_csr_binary(binary_name)
+
+            source_hash = _file_hash(file_name)
+            if header['hash'] == source_hash:
+                # same content, only refresh the mtime stored in the header
+                with open(binary_name, 'r+b') as file:
+                    file.seek(_MTIME_OFFSET)
+                    file.write(struct.pack('<q', mtime))
+                return read_csr_binary(binary_name)
+
+    source_hash = _file_hash(file_name)
+    matrix = read_matrix_csr(file_name, tol)
+
+    os.makedirs(os.path.dirname(binary_name), exist_ok=True)
+    write_csr_binary(binary_name, matrix, mtime, source_hash, tol)
+
+    return read_csr_binary(binary_name)
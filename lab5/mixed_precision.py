@@ -0,0 +1,172 @@
+import os
+from time import time
+
+import numpy as np
+
+from matrix_functions import spmv, spmm
+from matrix_io import load_matrix_csr
+from ordering import permute_symmetric
+from cholesky_supernodal import numeric_cholesky_supernodal
+from cholesky_solve import CholeskyFactor, cholesky_analysis
+
+
+def _matvec(A):
+    if callable(A):
+        return A
+    return lambda X: spmv(A, X) if X.ndim == 1 else spmm(A, X)
+
+
+def iterative_refinement(A, B, solve, tol=1e-12, max_iter=10, stall=0.5):
+    '''X with A @ X = B from an approximate solver, e.g. the solve of a float32
+        factor: X = solve(B), then X += solve(B - A @ X) with the residual
+        computed in float64, until norm(r) <= tol * norm(b)
+        A is a matrix in CSR format or any function X -> A @ X, B one vector
+        or right-hand sides as columns
+        stops as stalled when a step does not reduce the residual at least
+        by the stall factor (the factor is too inaccurate for the matrix)
+        returns (X, info) - info has iterations, converged, stalled and
+        residuals (largest relative residual norm before every step)'''
+    matvec = _matvec(A)
+    B = np.asarray(B, dtype=np.float64)
+    B_norm = np.linalg.norm(B, axis=0)
+    B_norm = np.where(B_norm == 0, 1.0, B_norm)
+
+    X = np.asarray(solve(B), dtype=np.float64)
+    residuals = []
+    stalled = False
+    iterations = 0
+    while True:
+        R = B - matvec(X)
+        residuals.append(float(np.max(np.linalg.norm(R, axis=0) / B_norm)))
+        if residuals[-1] <= tol or iterations == max_iter:
+            break
+        if len(residuals) > 1 and residuals[-1] > stall * residuals[-2]:
+            stalled = True
+            break
+
+        X += solve(R)
+        iterations += 1
+
+    info = {
+        'iterations': iterations,
+        'converged': residuals[-1] <= tol,
+        'stalled': stalled,
+        'residuals': residuals,
+    }
+    return X, info
+
+
+def mixed_precision_solve(A, B, tol=1e-12, max_iter=10, ordering='auto', factor=None, fallback=True):
+    '''solves A @ X = B for symmetric positive definite A in CSR format,
+        factoring it in float32 (VAL of the factor half the size) and
+        recovering float64 accuracy with iterative_refinement
+        when the refinement does not converge or the float32 factorization
+        breaks down, A is factored again in float64 with the same ordering and
+        symbolic analysis (recomputed if the factor has none), fallback=False returns the refined float32 result
+        as it is (or raises ValueError on the breakdown)
+        pass factor from a previous call to skip the factorization
+        the gain is the factor memory, not time - at the riga / fem sizes
+        the float32 factorization plus refinement is slower than float64
+        (the python overhead per supernode dominates, see compare_precision)
+        returns (X, info) - info of iterative_refinement (residuals of both
+        attempts) plus fallback (bool) and factor (CholeskyFactor used)'''
+    permutation, matrix = None, None
+    if factor is None:
+        permutation, matrix, symbolic = cholesky_analysis(A, ordering)
+        try:
+            U = numeric_cholesky_supernodal(matrix, symbolic, dtype=np.float32)
+            factor = CholeskyFactor(U, permutation, symbolic)
+        except ValueError:
+            if not fallback:
+                raise
+    else:
+        permutation, symbolic = factor.permutation, factor.symbolic
+
+    info = {'iterations': 0, 'residuals': []}
+    if factor is not None:
+        X, info = iterative_refinement(A, B, factor.solve, tol, max_iter)
+        if info['converged'] or not fallback or factor.U.VAL.dtype == np.float64:
+            info.update(fallback=False, factor=factor)
+            return X, info
+
+    if matrix is None:
+        matrix = A if permutation is None else permute_symmetric(A, permutation)
+    if symbolic is None:
+        # e.g. a factor from cholesky_update with fill-in, its pattern is not A's
+        _, matrix, symbolic = cholesky_analysis(matrix, 'natural')
+    U = numeric_cholesky_supernodal(matrix, symbolic)
+    factor = CholeskyFactor(U, permutation, symbolic)
+
+    X, double = iterative_refinement(A, B, factor.solve, tol, max_iter)
+    double['iterations'] += info['iterations']
+    double['residuals'] = info['residuals'] + double['residuals']
+    double.update(fallback=True, factor=factor)
+    return X, double
+
+
+def compare_precision(A, b=None, tol=1e-12, ordering='auto'):
+    '''float64 factorization + solve against float32 factorization +
+        iterative refinement for one right-hand side, both with the same
+        ordering and symbolic analysis (timed separately as analysis)
+        returns {'analysis' [s], 'float64': {...}, 'float32': {...},
+        'memory_saved' [B], 'speedup'}, every precision with numeric and
+        solve times [s], iterations, factor_bytes (VAL) and error (relative
+        residual), speedup is float64 total / float32 total'''
+    n = len(A[2]) - 1
+    if b is None:
+        b = np.ones(n)
+
+    start = time()
+    permutation, matrix, symbolic = cholesky_analysis(A, ordering)
+    results = {'analysis': time() - start}
+
+    for dtype in (np.float64, np.float32):
+        start = time()
+        factor = CholeskyFactor(numeric_cholesky_supernodal(matrix, symbolic, dtype=dtype),
+                                permutation, symbolic)
+        numeric = time() - start
+
+        start = time()
+        if dtype == np.float64:
+            x = factor.solve(b)
+            iterations = 0
+        else:
+            x, info = mixed_precision_solve(A, b, tol, factor=factor, fallback=False)
+            iterations = info['iterations']
+        solve = time() - start
+
+        results[np.dtype(dtype).name] = {
+            'numeric': numeric,
+            'solve': solve,
+            'total': numeric + solve,
+            'iterations': iterations,
+            'factor_bytes': factor.U.VAL.nbytes,
+            'error': float(np.linalg.norm(b - spmv(A, x)) / np.linalg.norm(b)),
+        }
+
+    double, single = results['float64'], results['float32']
+    results['memory_saved'] = double['factor_bytes'] - single['factor_bytes']
+    results['speedup'] = double['total'] / single['total']
+    return results
+
+
+def precision_report(file_names, tol=1e-12, ordering='auto'):
+    '''compare_precision for every Octave matrix file (e.g. riga_* and fem_*
+        from lab2/matrices), prints one line per matrix
+        returns {matrix name: compare_precision result}'''
+    print('{:<10} {:>6} {:>10} {:>10} {:>6} {:>9} {:>9} {:>9}'.format(
+        'matrix', 'n', 'f64 [B]', 'f32 [B]', 'iters', 'f64 err', 'f32 err', 'speedup'))
+
+    report = {}
+    for file_name in file_names:
+        name = os.path.splitext(os.path.basename(file_name))[0]
+        A = load_matrix_csr(file_name)
+        result = compare_precision(A, tol=tol, ordering=ordering)
+        report[name] = result
+
+        double, single = result['float64'], result['float32']
+        print('{:<10} {:>6} {:>10} {:>10} {:>6} {:>9.1e} {:>9.1e} {:>9.2f}'.format(
+            name, A.shape[0], double['factor_bytes'], single['factor_bytes'],
+            single['iterations'], double['error'], single['error'], result['speedup']))
+
+    return report
@@ -0,0 +1,349 @@
+import heapq
+
+import numpy as np
+
+from csr_matrix import CSRMatrix
+from cholesky_symbolic import column_counts, cholesky_flops
+
+
+def adjacency_graph(matrix):
+    '''graph of the matrix as (ADJ, ADJPTR) arrays - CSR without values,
+        neighbours of node v are ADJ[ADJPTR[v]:ADJPTR[v+1]]
+        the diagonal is skipped and the pattern is symmetrized, so the graph
+        is the same as elimination_graph_csr builds with networkx'''
+    ICL, _, ROWPTR = matrix
+    n = len(ROWPTR) - 1
+    cols = np.asarray(ICL, dtype=np.int64)
+    rows = np.repeat(np.arange(n, dtype=np.int64), np.diff(ROWPTR))
+
+    off_diagonal = rows != cols
+    rows, cols = rows[off_diagonal], cols[off_diagonal]
+    rows, cols = np.concatenate((rows, cols)), np.concatenate((cols, rows))
+
+    # unique edges, sorted by node then by neighbour
+    keys = np.unique(rows * n + cols)
+    rows, ADJ = keys // n, keys % n
+
+    ADJPTR = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=ADJPTR[1:])
+    return ADJ, ADJPTR
+
+
+def _bfs_levels(ADJ, ADJPTR, start, mask=None):
+    '''breadth first search from start, returns (visited order, level of every node)
+        levels of unreached nodes are -1, mask limits the search to a subset'''
+    n = len(ADJPTR) - 1
+    level = np.full(n, -1, dtype=np.int64)
+    level[start] = 0
+    order = [start]
+    head = 0
+
+    while head < len(order):
+        v = order[head]
+        head += 1
+        neighbours = ADJ[ADJPTR[v]:ADJPTR[v+1]]
+        new = neighbours[level[neighbours] == -1]
+        if mask is not None:
+            new = new[mask[new]]
+        level[new] = level[v] + 1
+        order.extend(new.tolist())
+
+    return np.array(order, dtype=np.int64), level
+
+
+def pseudo_peripheral_node(ADJ, ADJPTR, start, mask=None):
+    '''node far from the "centre" of its connected component (George-Liu),
+        repeated BFS from the minimum degree node of the last level
+        as long as the eccentricity grows'''
+    degree = np.diff(ADJPTR)
+    order, level = _bfs_levels(ADJ, ADJPTR, start, mask)
+    eccentricity = level[order[-1]]
+
+    while True:
+        last_level = order[level[order] == eccentricity]
+        candidate = last_level[np.argmin(degree[last_level])]
+        candidate_order, candidate_level = _bfs_levels(ADJ, ADJPTR, candidate, mask)
+        candidate_eccentricity = candidate_level[candidate_order[-1]]
+        if candidate_eccentricity <= eccentricity:
+            return start
+        start, order, level, eccentricity = \
+            candidate, candidate_order, candidate_level, candidate_eccentricity
+
+
+def cuthill_mckee(matrix):
+    '''Cuthill-McKee ordering, returns permutation vector
+        (perm[i] is the old index of the node placed at position i)
+        every connected component is searched breadth first from
+        a pseudo-peripheral node, neighbours visited by increasing degree
+        the queue is an array with moving head, so it is O(nnz log(max degree))'''
+    ADJ, ADJPTR = adjacency_graph(matrix)
+    n = len(ADJPTR) - 1
+    degree = np.diff(ADJPTR)
+
+    visited = np.zeros(n, dtype=bool)
+    ordering = np.empty(n, dtype=np.int64)
+    tail = 0
+
+    for s in np.argsort(degree, kind='stable'):
+        if visited[s]:
+            continue
+        start = pseudo_peripheral_node(ADJ, ADJPTR, s, ~visited)
+
+        head = tail
+        ordering[tail] = start
+        visited[start] = True
+        tail += 1
+        while head < tail:
+            v = ordering[head]
+            head += 1
+            neighbours = ADJ[ADJPTR[v]:ADJPTR[v+1]]
+            neighbours = neighbours[~visited[neighbours]]
+            neighbours = neighbours[np.argsort(degree[neighbours], kind='stable')]
+            visited[neighbours] = True
+            ordering[tail:tail+len(neighbours)] = neighbours
+            tail += len(neighbours)
+
+    return ordering
+
+
+def reverse_cuthill_mckee(matrix):
+    '''reversed Cuthill-McKee ordering, produces less fill-in than
+        the forward one for the same bandwidth'''
+    return cuthill_mckee(matrix)[::-1].copy()
+
+
+def approximate_minimum_degree(matrix):
+    '''approximate minimum degree ordering on the quotient graph
+        eliminated nodes become elements, so the graph never grows:
+        every variable keeps its variable neighbours A[i] and adjacent
+        elements E[i], element e keeps its variables L[e]
+        degrees are AMD bounds |A[i]| + |L[p]| + sum over other elements
+        of |L[e] \\ L[p]|, elements covered by the new one are absorbed'''
+    ADJ, ADJPTR = adjacency_graph(matrix)
+    n = len(ADJPTR) - 1
+
+    A = [set(ADJ[ADJPTR[i]:ADJPTR[i+1]].tolist()) for i in range(n)]
+    E = [set() for _ in range(n)]
+    L = {}
+    degree = [len(a) for a in A]
+    eliminated = [False] * n
+    w = [-1] * n
+
+    heap = [(degree[i], i) for i in range(n)]
+    heapq.heapify(heap)
+    ordering = []
+
+    while heap:
+        d, p = heapq.heappop(heap)
+        if eliminated[p] or d != degree[p]:
+            continue
+        eliminated[p] = True
+        ordering.append(p)
+
+        # new element p: variables adjacent to p directly or through its elements
+        Lp = set(A[p])
+        for e in E[p]:
+            Lp |= L.pop(e)
+        Lp.discard(p)
+        absorbed = E[p]
+        L[p] = Lp
+        A[p] = E[p] = None
+
+        # w[e] = |L[e] \ L[p]| for every element touching L[p]
+        for i in Lp:
+            for e in E[i]:
+                if e in absorbed:
+                    continue
+                if w[e] < 0:
+                    w[e] = len(L[e])
+                w[e] -= 1
+
+        size = len(Lp)
+        remaining = n - len(ordering)
+        for i in Lp:
+            A[i] -= Lp
+            A[i].discard(p)
+            E[i] -= absorbed
+            # aggressive absorption - elements fully inside L[p] are not needed
+            covered = [e for e in E[i] if w[e] == 0]
+            for e in covered:
+                E[i].discard(e)
+                L.pop(e, None)
+            E[i].add(p)
+
+            external = sum(w[e] for e in E[i] if e != p)
+            degree[i] = min(remaining - 1, degree[i] + size - 1, len(A[i]) + size - 1 + external)
+            heapq.heappush(heap, (degree[i], i))
+
+        for i in Lp:
+            for e in E[i]:
+                w[e] = -1
+
+    return np.array(ordering, dtype=np.int64)
+
+
+def _subgraph(ADJ, ADJPTR, nodes):
+    '''graph induced by nodes, with nodes renumbered to 0..len(nodes)-1'''
+    n = len(ADJPTR) - 1
+    local = np.full(n, -1, dtype=np.int64)
+    local[nodes] = np.arange(len(nodes))
+
+    counts = np.diff(ADJPTR)[nodes]
+    rows = np.repeat(np.arange(len(nodes)), counts)
+    starts = np.repeat(ADJPTR[nodes], counts)
+    offsets = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    cols = local[ADJ[starts + offsets]]
+
+    inside = cols >= 0
+    rows, cols = rows[inside], cols[inside]
+    sub_ADJPTR = np.zeros(len(nodes) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=len(nodes)), out=sub_ADJPTR[1:])
+    return cols, sub_ADJPTR
+
+
+def _graph_matrix(ADJ, ADJPTR):
+    # adjacency arrays in the (ICL, VAL, ROWPTR) form accepted by the orderings
+    return ADJ, np.ones(len(ADJ)), ADJPTR
+
+
+def nested_dissection(matrix, leaf_size=64):
+    '''nested dissection ordering - the graph is split by a level set separator
+        (middle level of the BFS from a pseudo-peripheral node), both parts
+        are ordered recursively and the separator goes last
+        parts smaller than leaf_size are ordered with approximate_minimum_degree'''
+    ADJ, ADJPTR = adjacency_graph(matrix)
+    n = len(ADJPTR) - 1
+    ordering = []
+
+    # explicit stack of (nodes, separator already placed after them)
+    # parts are pushed in reverse, so the output is part1, part2, separator
+    stack = [('part', np.arange(n, dtype=np.int64))]
+    while stack:
+        kind, nodes = stack.pop()
+        if kind == 'separator' or len(nodes) == 0:
+            ordering.extend(nodes.tolist())
+            continue
+
+        sub_ADJ, sub_ADJPTR = _subgraph(ADJ, ADJPTR, nodes)
+        if len(nodes) <= leaf_size:
+            local = approximate_minimum_degree(_graph_matrix(sub_ADJ, sub_ADJPTR))
+            ordering.extend(nodes[local].tolist())
+            continue
+
+        degree = np.diff(sub_ADJPTR)
+        start = pseudo_peripheral_node(sub_ADJ, sub_ADJPTR, int(np.argmin(degree)))
+        order, level = _bfs_levels(sub_ADJ, sub_ADJPTR, start)
+
+        if len(order) < len(nodes):
+            # disconnected - the reached component and the rest are independent
+            reached = level >= 0
+            stack.append(('part', nodes[~reached]))
+            stack.append(('part', nodes[reached]))
+            continue
+
+        # middle level splits the component into two halves
+        level_sizes = np.bincount(level)
+        middle = int(np.searchsorted(np.cumsum(level_sizes), len(nodes) // 2))
+        if middle == 0 or middle == len(level_sizes) - 1:
+            local = approximate_minimum_degree(_graph_matrix(sub_ADJ, sub_ADJPTR))
+            ordering.extend(nodes[local].tolist())
+            continue
+
+        stack.append(('separator', nodes[level == middle]))
+        stack.append(('part', nodes[level > middle]))
+        stack.append(('part', nodes[level < middle]))
+
+    return np.array(ordering, dtype=np.int64)
+
+
+def inverse_permutation(permutation):
+    '''inverse[old index] = new index'''
+    permutation = np.asarray(permutation, dtype=np.int64)
+    inverse = np.empty_like(permutation)
+    inverse[permutation] = np.arange(len(permutation))
+    return inverse
+
+
+def permute_pattern(ICL, ROWPTR, permutation):
+    '''pattern of P @ A @ P.T for the permutation vector, returns (ICL, ROWPTR,
+        source), source[p] is the index of the value of A that lands on
+        position p, so any value array of A is permuted by VAL[source]
+        row i of the result is row permutation[i] of A with columns relabelled
+        by the inverse permutation, then sorted inside every row'''
+    ICL = np.asarray(ICL)
+    ROWPTR = np.asarray(ROWPTR, dtype=np.int64)
+    permutation = np.asarray(permutation, dtype=np.int64)
+    inverse = inverse_permutation(permutation)
+    n = len(ROWPTR) - 1
+
+    counts = np.diff(ROWPTR)[permutation]
+    new_ROWPTR = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(counts, out=new_ROWPTR[1:])
+
+    # index in the old arrays of every value, in the new row order
+    rows = np.repeat(np.arange(n, dtype=np.int64), counts)
+    source = np.repeat(ROWPTR[permutation] - new_ROWPTR[:-1], counts) + np.arange(new_ROWPTR[-1])
+    cols = inverse[ICL[source]]
+
+    order = np.lexsort((cols, rows))
+    return cols[order], new_ROWPTR, source[order]
+
+
+def permute_symmetric(matrix, permutation):
+    '''P @ matrix @ P.T for the permutation vector, without building P
+        (see permute_pattern)'''
+    ICL, VAL, ROWPTR = matrix
+    n = len(ROWPTR) - 1
+    new_ICL, new_ROWPTR, source = permute_pattern(ICL, ROWPTR, permutation)
+    return CSRMatrix(new_ICL, np.asarray(VAL, dtype=np.float64)[source], new_ROWPTR, (n, n))
+
+
+def unpermute_symmetric(matrix, permutation):
+    '''inverse of permute_symmetric: P.T @ matrix @ P'''
+    return permute_symmetric(matrix, inverse_permutation(permutation))
+
+
+ORDERINGS = {
+    'natural': lambda matrix: np.arange(len(matrix[2]) - 1, dtype=np.int64),
+    'cm': cuthill_mckee,
+    'rcm': reverse_cuthill_mckee,
+    'amd': approximate_minimum_degree,
+    'nd': nested_dissection,
+}
+
+
+def fill_in_estimate(matrix, permutation=None):
+    '''symbolic prediction of the factorization cost for the given ordering,
+        from the elimination tree and column counts - no numeric work
+        returns dict with nnz of L, fill-in (new nonzeros of L compared to
+        the lower triangle of the matrix) and flops'''
+    if permutation is not None:
+        matrix = permute_symmetric(matrix, permutation)
+
+    ICL, _, ROWPTR = matrix
+    n = len(ROWPTR) - 1
+    rows = np.repeat(np.arange(n), np.diff(ROWPTR))
+    nnz_lower = int(np.count_nonzero(np.asarray(ICL) <= rows))
+
+    colcount, _ = column_counts(matrix)
+    nnz_L = int(colcount.sum())
+    return {
+        'nnz_L': nnz_L,
+        'fill_in': nnz_L - nnz_lower,
+        'flops': cholesky_flops(colcount),
+    }
+
+
+def select_ordering(matrix, methods=('natural', 'rcm', 'amd'), criterion='flops'):
+    '''tries every ordering from methods and picks the cheapest one
+        according to fill_in_estimate[criterion]
+        returns (name, permutation, {name: estimate})'''
+    estimates = {}
+    best = None
+    for name in methods:
+        permutation = ORDERINGS[name](matrix)
+        estimates[name] = fill_in_estimate(matrix, permutation)
+        if best is None or estimates[name][criterion] < estimates[best[0]][criterion]:
+            best = (name, permutation)
+
+    return best[0], best[1], estimates
@@ -0,0 +1,102 @@
+from time import time
+
+import numpy as np
+
+from matrix_functions import spmv
+from cholesky_solve import cholesky_factor
+from incomplete_cholesky import incomplete_cholesky, ic_preconditioner
+
+
+def pcg(A, b, preconditioner=None, tol=1e-8, maxiter=None, x0=None):
+    '''preconditioned conjugate gradient for symmetric positive definite A
+        A is a matrix in CSR format or any function x -> A @ x (matrix free),
+        preconditioner a function r -> inv(M) @ r (e.g. ic_preconditioner),
+        stops when norm(r) <= tol * norm(b)
+        only a few vectors of length n are kept besides A and the preconditioner
+        returns (x, info) - info has iterations, converged, residuals
+        (relative residual norm after every iteration) and time [s]'''
+    start = time()
+    matvec = A if callable(A) else (lambda x: spmv(A, x))
+    b = np.asarray(b, dtype=np.float64)
+    n = len(b)
+    if maxiter is None:
+        maxiter = 10 * n
+
+    x = np.zeros(n) if x0 is None else np.array(x0, dtype=np.float64)
+    r = b - matvec(x) if x0 is not None else b.copy()
+    b_norm = np.linalg.norm(b) or 1.0
+
+    z = preconditioner(r) if preconditioner is not None else r
+    p = z.copy()
+    rz = r @ z
+    residuals = [np.linalg.norm(r) / b_norm]
+
+    iterations = 0
+    while residuals[-1] > tol and iterations < maxiter:
+        q = matvec(p)
+        alpha = rz / (p @ q)
+        x += alpha * p
+        r -= alpha * q
+        iterations += 1
+        residuals.append(np.linalg.norm(r) / b_norm)
+        if residuals[-1] <= tol:
+            break
+
+        z = preconditioner(r) if preconditioner is not None else r
+        rz_next = r @ z
+        p *= rz_next / rz
+        p += z
+        rz = rz_next
+
+    info = {
+        'iterations': iterations,
+        'converged': residuals[-1] <= tol,
+        'residuals': residuals,
+        'time': time() - start,
+    }
+    return x, info
+
+
+def compare_with_direct(A, b=None, tol=1e-8, ict_tol=1e-3, fill=None):
+    '''time to solution of CG, IC(0)-PCG, ICT-PCG and the direct sparse
+        factorization (cholesky_factor + solve) for one right-hand side
+        returns {method: {'setup', 'solve', 'total' [s], 'iterations', 'nnz', 'error'}},
+        nnz is the size of the factor / preconditioner, error the relative residual'''
+    n = len(A[2]) - 1
+    if b is None:
+        b = np.ones(n)
+
+    def residual(x):
+        return float(np.linalg.norm(b - spmv(A, x)) / np.linalg.norm(b))
+
+    results = {}
+
+    start = time()
+    factor = cholesky_factor(A)
+    setup = time() - start
+    start = time()
+    x = factor.solve(b)
+    results['direct'] = {'setup': setup, 'solve': time() - start, 'iterations': None,
+                         'nnz': factor.U.nnz, 'error': residual(x)}
+
+    preconditioners = {
+        'cg': None,
+        'ic0': {'level_zero': True},
+        'ict': {'tol': ict_tol, 'fill': fill},
+    }
+    for name, options in preconditioners.items():
+        start = time()
+        if options is None:
+            preconditioner, nnz = None, 0
+        else:
+            U, _ = incomplete_cholesky(A, **options)
+            preconditioner, nnz = ic_preconditioner(U), U.nnz
+        setup = time() - start
+
+        x, info = pcg(A, b, preconditioner, tol)
+        results[name] = {'setup': setup, 'solve': info['time'], 'iterations': info['iterations'],
+                         'nnz': nnz, 'error': residual(x)}
+
+    for result in results.values():
+        result['total'] = result['setup'] + result['solve']
+    return results
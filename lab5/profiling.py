@@ -0,0 +1,122 @@
+import json
+import tracemalloc
+from time import perf_counter
+
+
+class CholeskyProfiler:
+    '''per pivot statistics of sparse_cholesky, pass it as
+        sparse_cholesky(matrix, profiler=CholeskyProfiler())
+        without a profiler the factorization runs no extra code in the
+        inner loops - all hooks are called once per pivot
+
+        every pivot k records
+            row_length   - nonzeros of row k of L.T
+            updated_rows - rows j > k the pivot row is subtracted from
+            fill         - new nonzero positions created in those rows
+            dropped      - computed values dropped below the 1e-8 tolerance
+            nnz          - nonzeros of the working matrix after the step
+            search, merge, rebuild - time [s] of get_col_in_row binary
+                           searches, the row merges, and copying the finished
+                           part of the lists for the next step
+            memory_current, memory_peak - traced memory [B] after the step
+                           and its peak during the step (memory=True only,
+                           tracemalloc slows the list appends down several times,
+                           so times of such run are not comparable)
+                           if tracing is already on (e.g. benchmark.py), it is
+                           left running and its peak is not reset, so
+                           memory_peak is then the peak since the outer start'''
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.pivots = []
+        self.initial_nnz = None
+        self.total_time = 0.0
+        self._search_time = 0.0
+        self._owns_tracing = False
+
+    def timed_search(self, search):
+        '''wraps get_col_in_row, so its calls are counted to the search phase'''
+        def timed(row, col):
+            start = perf_counter()
+            result = search(row, col)
+            self._search_time += perf_counter() - start
+            return result
+        return timed
+
+    def start(self, ICL):
+        self.pivots = []
+        self.initial_nnz = len(ICL)
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracing = True
+        self._start = perf_counter()
+
+    def start_pivot(self, k):
+        self._search_time = 0.0
+        if self._owns_tracing:
+            tracemalloc.reset_peak()
+        self._pivot_start = perf_counter()
+
+    def copied(self):
+        self._copied = perf_counter()
+
+    def end_pivot(self, k, ICL, ROWPTR, new_icl, new_rowptr):
+        end = perf_counter()
+        row_start, row_end = ROWPTR[k], ROWPTR[k+1]
+        top = ICL[row_start+1:row_end]
+
+        # rows the pivot row was subtracted from are the columns of its
+        # off-diagonal part, compare their old and new structure from column j on
+        fill = dropped = 0
+        for position, j in enumerate(top):
+            old = {col for col in ICL[ROWPTR[j]:ROWPTR[j+1]] if col >= j}
+            merged = old.union(top[position:])
+            fill += len(merged) - len(old)
+            dropped += len(merged) - (new_rowptr[j+1] - new_rowptr[j])
+
+        stats = {
+            'k': k,
+            'row_length': row_end - row_start,
+            'updated_rows': len(top),
+            'fill': fill,
+            'dropped': dropped,
+            'nnz': len(new_icl),
+            'search': self._search_time,
+            'merge': end - self._copied - self._search_time,
+            'rebuild': self._copied - self._pivot_start,
+        }
+        if self.memory:
+            stats['memory_current'], stats['memory_peak'] = tracemalloc.get_traced_memory()
+        self.pivots.append(stats)
+
+    def finish(self):
+        self.total_time = perf_counter() - self._start
+        if self._owns_tracing:
+            tracemalloc.stop()
+            self._owns_tracing = False
+
+    def nnz_growth(self):
+        '''nonzeros of the working matrix before the first and after every pivot'''
+        return [self.initial_nnz] + [stats['nnz'] for stats in self.pivots]
+
+    def summary(self):
+        '''totals over all pivots
+            search includes the two perf_counter calls of the timed_search
+            wrapper around every get_col_in_row call, the rest of the wrapper
+            call overhead is counted to merge'''
+        summary = {'pivots': len(self.pivots), 'initial_nnz': self.initial_nnz,
+                   'total_time': self.total_time}
+        for key in ('fill', 'dropped', 'search', 'merge', 'rebuild'):
+            summary[key] = sum(stats[key] for stats in self.pivots)
+        summary['final_nnz'] = self.pivots[-1]['nnz'] if self.pivots else self.initial_nnz
+        if self.memory:
+            summary['memory_peak'] = max((stats['memory_peak'] for stats in self.pivots), default=0)
+        return summary
+
+    def trace(self):
+        '''whole trace as a json serializable dict'''
+        return {'summary': self.summary(), 'nnz_growth': self.nnz_growth(), 'pivots': self.pivots}
+
+    def to_json(self, file_name):
+        with open(file_name, 'w') as file:
+            json.dump(self.trace(), file, indent=2)
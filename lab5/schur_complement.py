@@ -0,0 +1,71 @@
+import numpy as np
+
+from csr_matrix import CSRMatrix
+from ordering import permute_symmetric
+from cholesky_solve import cholesky_factor, solve_lower
+
+
+def interface_permutation(n, interface):
+    '''permutation putting the interior nodes first (in their original order)
+        and the interface nodes last, interface is an index array
+        or a number m meaning the last m nodes
+        returns (permutation, number of interior nodes)'''
+    if np.isscalar(interface):
+        interface = np.arange(n - int(interface), n)
+    interface = np.asarray(interface, dtype=np.int64)
+
+    is_interface = np.zeros(n, dtype=bool)
+    is_interface[interface] = True
+    interior = np.flatnonzero(~is_interface)
+    return np.concatenate((interior, interface)), len(interior)
+
+
+def split_blocks(matrix, p):
+    '''splits the matrix in CSR format at index p into
+        A11 (CSRMatrix), A21 = A[p:, :p] and A22 = A[p:, p:] (both dense)'''
+    ICL, VAL, ROWPTR = matrix
+    ICL = np.asarray(ICL, dtype=np.int64)
+    VAL = np.asarray(VAL, dtype=np.float64)
+    ROWPTR = np.asarray(ROWPTR, dtype=np.int64)
+    n = len(ROWPTR) - 1
+    rows = np.repeat(np.arange(n), np.diff(ROWPTR))
+
+    leading = (rows < p) & (ICL < p)
+    A11_ROWPTR = np.zeros(p + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows[leading], minlength=p), out=A11_ROWPTR[1:])
+    A11 = CSRMatrix(ICL[leading], VAL[leading], A11_ROWPTR, (p, p))
+
+    A21 = np.zeros((n - p, p))
+    A22 = np.zeros((n - p, n - p))
+    trailing = rows >= p
+    left = trailing & (ICL < p)
+    A21[rows[left] - p, ICL[left]] = VAL[left]
+    right = trailing & (ICL >= p)
+    A22[rows[right] - p, ICL[right] - p] = VAL[right]
+
+    return A11, A21, A22
+
+
+def sparse_schur_complement(matrix, interface, ordering='auto'):
+    '''Schur complement S = A_BB - A_BI @ inv(A_II) @ A_IB of a symmetric
+        positive definite matrix in CSR format onto the interface nodes B
+        only the interior nodes I are eliminated: A_II is factored as a
+        sparse matrix (P A_II P.T = U.T U, fill reducing ordering), then
+        W = inv(U.T) @ P @ A_IB is one forward substitution with all interface
+        columns as right-hand sides and S = A_BB - W.T @ W one dense product
+        interface is an index array or a number m meaning the last m nodes
+        returns dense S, its rows and columns in the order of interface'''
+    n = len(matrix[2]) - 1
+    permutation, interior = interface_permutation(n, interface)
+
+    A11, A21, A22 = split_blocks(permute_symmetric(matrix, permutation), interior)
+    if interior == 0:
+        return A22
+
+    factor = cholesky_factor(A11, ordering)
+    A12 = A21.T
+    if factor.permutation is not None:
+        A12 = A12[factor.permutation]
+
+    W = solve_lower(factor.U, A12)
+    return A22 - W.T @ W
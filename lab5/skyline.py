@@ -0,0 +1,156 @@
+from time import time
+
+import numpy as np
+
+from csr_matrix import CSRMatrix
+from ordering import ORDERINGS, permute_symmetric
+from cholesky_permutation import sparse_cholesky_relabelled
+
+
+class SkylineMatrix:
+    '''symmetric matrix in variable band (skyline / envelope) storage,
+        lower triangle by rows: row i holds every column from FIRST[i]
+        to the diagonal as one contiguous profile, zeros inside included
+        VAL   - profiles of all rows one after another
+        PTR   - VAL index where every row starts, the diagonal of row i
+                is VAL[PTR[i+1] - 1]
+        FIRST - first column of the profile of every row
+        Cholesky factor keeps the same envelope, so it can be computed
+        in the same arrays without any fill-in bookkeeping'''
+
+    __slots__ = ('VAL', 'PTR', 'FIRST')
+
+    def __init__(self, VAL, PTR, FIRST):
+        self.VAL = np.asarray(VAL, dtype=np.float64)
+        self.PTR = np.asarray(PTR, dtype=np.int64)
+        self.FIRST = np.asarray(FIRST, dtype=np.int64)
+
+    def __repr__(self):
+        return '<SkylineMatrix {0}x{0}, profile={1}>'.format(self.n, self.profile)
+
+    @property
+    def n(self):
+        return len(self.FIRST)
+
+    @property
+    def profile(self):
+        '''number of stored values (envelope size, diagonal included)'''
+        return len(self.VAL)
+
+    @property
+    def bandwidth(self):
+        return int(np.max(np.arange(self.n) - self.FIRST)) if self.n else 0
+
+    def copy(self):
+        return SkylineMatrix(self.VAL.copy(), self.PTR.copy(), self.FIRST.copy())
+
+    def lower_dense(self):
+        '''lower triangle as a dense matrix'''
+        rows = np.repeat(np.arange(self.n), np.diff(self.PTR))
+        cols = np.arange(self.profile) - self.PTR[rows] + self.FIRST[rows]
+        matrix = np.zeros((self.n, self.n))
+        matrix[rows, cols] = self.VAL
+        return matrix
+
+    def to_dense(self):
+        lower = self.lower_dense()
+        return lower + np.tril(lower, -1).T
+
+
+def skyline_from_csr(matrix, permutation=None):
+    '''envelope storage of P @ matrix @ P.T for symmetric matrix in CSR format,
+        permutation is a vector or a name from ORDERINGS (e.g. 'rcm'),
+        only the lower triangle of the matrix is read'''
+    if isinstance(permutation, str):
+        permutation = ORDERINGS[permutation](matrix)
+    if permutation is not None:
+        matrix = permute_symmetric(matrix, permutation)
+
+    ICL, VAL, ROWPTR = matrix
+    ICL = np.asarray(ICL, dtype=np.int64)
+    VAL = np.asarray(VAL, dtype=np.float64)
+    ROWPTR = np.asarray(ROWPTR, dtype=np.int64)
+    n = len(ROWPTR) - 1
+    rows = np.repeat(np.arange(n), np.diff(ROWPTR))
+    lower = ICL <= rows
+
+    FIRST = np.arange(n)
+    np.minimum.at(FIRST, rows[lower], ICL[lower])
+    PTR = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.arange(n) - FIRST + 1, out=PTR[1:])
+
+    SKY = np.zeros(PTR[-1])
+    SKY[PTR[rows[lower]] + ICL[lower] - FIRST[rows[lower]]] = VAL[lower]
+    return SkylineMatrix(SKY, PTR, FIRST)
+
+
+def skyline_cholesky(matrix):
+    '''returns L (lower triangular) in skyline storage, that L @ L.T == matrix
+        row oriented (bordering) Cholesky: the envelope part of row i,
+        x = L[i, f:i] with f = FIRST[i], solves L[f:i, f:i] @ x = A[i, f:i],
+        the block of the rows above is gathered from VAL (zeros outside their
+        profiles) and solved at once, then L[i, i] = sqrt(A[i, i] - x @ x)'''
+    L = matrix.copy()
+    VAL, PTR, FIRST = L.VAL, L.PTR, L.FIRST
+
+    for i in range(L.n):
+        fi, pi, di = FIRST[i], PTR[i], PTR[i+1] - 1
+        if fi < i:
+            # offsets[r, c] - position of L[fi + r, fi + c] in the profile of row fi + r
+            firsts = FIRST[fi:i, None]
+            offsets = np.arange(fi, i) - firsts
+            inside = (offsets >= 0) & (offsets <= np.arange(fi, i)[:, None] - firsts)
+            block = np.where(inside, VAL[np.where(inside, PTR[fi:i, None] + offsets, 0)], 0)
+            VAL[pi:di] = np.linalg.solve(block, VAL[pi:di])
+
+        row = VAL[pi:di]
+        dii = VAL[di] - row @ row
+        if dii <= 0:
+            raise ValueError('nonpositive value on diagonal')
+        VAL[di] = dii ** 0.5
+
+    return L
+
+
+def skyline_to_csr(L):
+    '''L.T in CSR format (rows of L.T are the columns of L), explicit
+        zeros of the envelope are left out'''
+    rows = np.repeat(np.arange(L.n), np.diff(L.PTR))
+    cols = np.arange(L.profile) - L.PTR[rows] + L.FIRST[rows]
+    nonzero = L.VAL != 0
+
+    # L.T row index is the column of L
+    order = np.lexsort((rows[nonzero], cols[nonzero]))
+    ROWPTR = np.zeros(L.n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(cols[nonzero], minlength=L.n), out=ROWPTR[1:])
+    return CSRMatrix(rows[nonzero][order], L.VAL[nonzero][order], ROWPTR, (L.n, L.n))
+
+
+def compare_with_csr(matrix, permutation='rcm'):
+    '''sizes and factorization times of skyline_cholesky and the CSR
+        sparse_cholesky_relabelled for the same ordering
+        returns dict with nnz (lower triangle of A), profile, nnz of L,
+        skyline and csr factorization times [s]'''
+    if isinstance(permutation, str):
+        permutation = ORDERINGS[permutation](matrix)
+
+    skyline = skyline_from_csr(matrix, permutation)
+
+    start = time()
+    L = skyline_cholesky(skyline)
+    skyline_time = time() - start
+
+    start = time()
+    U = sparse_cholesky_relabelled(matrix, permutation)
+    csr_time = time() - start
+
+    ICL, _, ROWPTR = matrix
+    rows = np.repeat(np.arange(len(ROWPTR) - 1), np.diff(ROWPTR))
+    return {
+        'nnz': int(np.count_nonzero(np.asarray(ICL) <= rows)),
+        'profile': skyline.profile,
+        'nnz_L': len(U[1]),
+        'skyline_time': skyline_time,
+        'csr_time': csr_time,
+        'max_difference': float(np.abs(L.lower_dense().T - CSRMatrix(*U).to_dense()).max()),
+    }